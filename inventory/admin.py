@@ -1,16 +1,20 @@
 from django.contrib import admin
+from django.forms.models import BaseInlineFormSet
 from django.db.models import F, Sum, Count
 from django.utils.html import format_html
 from django.urls import reverse
 from django.utils.safestring import mark_safe
 from .models import (
     Product, Customer, Sale, SaleItem, Category,
-    StockTransaction, ProductPriceHistory, SaleReturn
+    StockTransaction, ProductPriceHistory, SaleReturn, StockAlert
 )
 from django.core.exceptions import ValidationError
 from django.db.models.deletion import ProtectedError
 from django.db.transaction import atomic
 from django.db import transaction
+from . import services, stock
+from .forms import StockTransactionForm
+from .pagination import EstimatedCountPaginator
 import json
 
 @admin.register(Category)
@@ -19,16 +23,31 @@ class CategoryAdmin(admin.ModelAdmin):
     search_fields = ('name', 'description')
     ordering = ('name',)
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(num_products=Count('products'))
+
     def product_count(self, obj):
-        return obj.products.count()
+        return obj.num_products
     product_count.short_description = 'Products'
+    product_count.admin_order_field = 'num_products'
+
+class RecentStockTransactionFormSet(BaseInlineFormSet):
+    """Only the most recent ``max_rows`` transactions of the product."""
+    max_rows = 20
+
+    def get_queryset(self):
+        if not hasattr(self, '_queryset'):
+            self._queryset = super().get_queryset().order_by('-created_at', '-id')[:self.max_rows]
+        return self._queryset
 
 class StockTransactionInline(admin.TabularInline):
     model = StockTransaction
+    formset = RecentStockTransactionFormSet
     extra = 0
     readonly_fields = ('created_at', 'previous_stock', 'new_stock')
     fields = ('transaction_type', 'quantity', 'is_increase', 'notes', 'created_at', 'previous_stock', 'new_stock')
     can_delete = False
+    verbose_name_plural = f'Recent stock transactions (latest {RecentStockTransactionFormSet.max_rows})'
 
     def has_add_permission(self, request, obj=None):
         return False
@@ -52,9 +71,10 @@ class ProductAdmin(admin.ModelAdmin):
         'selling_price', 'profit_margin', 'is_active'
     )
     list_filter = ('category', 'is_active', 'low_stock_alert')
+    list_select_related = ('category',)
     search_fields = ('name', 'category__name', 'barcode')
     ordering = ('name',)
-    readonly_fields = ('profit_margin', 'image_preview', 'created_at', 'updated_at')
+    readonly_fields = ('profit_margin', 'image_preview', 'stock_history_link', 'created_at', 'updated_at')
     list_editable = ('is_active', 'min_stock_level', 'purchase_price', 'selling_price')
     inlines = [StockTransactionInline, ProductPriceHistoryInline]
     actions = ['bulk_restock']
@@ -71,7 +91,7 @@ class ProductAdmin(admin.ModelAdmin):
         ('Stock Management', {
             'fields': (
                 'stock_quantity', 'min_stock_level', 'max_stock_level',
-                'low_stock_alert'
+                'low_stock_alert', 'stock_history_link'
             )
         }),
         ('Pricing', {
@@ -101,6 +121,17 @@ class ProductAdmin(admin.ModelAdmin):
         return '-'
     profit_margin.short_description = 'Margin'
 
+    def stock_history_link(self, obj):
+        if not obj.pk:
+            return '-'
+        changelist = reverse('admin:inventory_stocktransaction_changelist')
+        api = reverse('inventory:stock_history', args=[obj.pk])
+        return format_html(
+            '<a href="{}?product__id__exact={}">View full stock history</a> (<a href="{}">JSON</a>)',
+            changelist, obj.pk, api
+        )
+    stock_history_link.short_description = 'Stock history'
+
     def image_preview(self, obj):
         if obj.image:
             return format_html('<img src="{}" style="max-height: 80px;"/>', obj.image.url)
@@ -108,15 +139,15 @@ class ProductAdmin(admin.ModelAdmin):
     image_preview.short_description = 'Image'
 
     def bulk_restock(self, request, queryset):
-        for product in queryset:
-            space_available = product.max_stock_level - product.stock_quantity
-            if space_available > 0:
-                product.update_stock(
-                    space_available,
-                    transaction_type='PURCHASE',
-                    notes='Bulk restock to maximum level'
-                )
-        self.message_user(request, f"Successfully restocked {queryset.count()} products")
+        restocked, skipped = stock.restock_to_max(
+            queryset,
+            transaction_type='PURCHASE',
+            notes='Bulk restock to maximum level'
+        )
+        message = f"Successfully restocked {restocked} products"
+        if skipped:
+            message += f"; skipped {skipped} already at maximum level"
+        self.message_user(request, message)
     bulk_restock.short_description = "Restock selected products to maximum level"
 
     class Media:
@@ -154,41 +185,38 @@ class SaleItemInline(admin.TabularInline):
 class SaleAdmin(admin.ModelAdmin):
     list_display = ('id', 'customer', 'date', 'total_amount', 'profit', 'is_paid')
     list_filter = ('is_paid', 'date', 'customer')
+    list_select_related = ('customer',)
     search_fields = ('customer__name',)
     inlines = [SaleItemInline]
     readonly_fields = ('total_amount', 'profit', 'date')
     ordering = ('-date',)
+    actions = ['recalculate_totals']
     
     class Media:
         js = ('admin/js/sale_form.js',)
 
+    def recalculate_totals(self, request, queryset):
+        for sale in queryset:
+            sale.recalculate_totals()
+        self.message_user(request, f"Recalculated totals for {len(queryset)} sales")
+    recalculate_totals.short_description = "Recalculate totals from sale items"
+
     def get_readonly_fields(self, request, obj=None):
         return ('total_amount', 'profit', 'date')
 
     def delete_queryset(self, request, queryset):
-        """Override delete_queryset to handle bulk deletions properly"""
-        with transaction.atomic():
-            # First restore stock for all sale items
-            for sale in queryset:
-                items_to_restore = list(sale.items.all())
-                for item in items_to_restore:
-                    print(f"DEBUG: Bulk delete - Restoring {item.quantity} units of {item.product.name}")
-                    actual_change = item.product.update_stock(
-                        item.quantity,
-                        transaction_type='ADJUSTMENT',
-                        notes=f'Restored from bulk sale deletion'
-                    )
-                    if actual_change != item.quantity:
-                        print(f"DEBUG: Warning: Could not fully restore stock for {item.product.name}. Expected +{item.quantity}, actual +{actual_change}")
-            
-            # Then delete all sales
-            queryset.delete()
+        """Restore stock per product with set-based updates, then delete the sales"""
+        services.delete_sales(queryset)
 
 @admin.register(StockTransaction)
 class StockTransactionAdmin(admin.ModelAdmin):
+    form = StockTransactionForm
     list_display = ('product', 'transaction_type', 'quantity', 'is_increase',
                    'previous_stock', 'new_stock', 'created_at')
     list_filter = ('transaction_type', 'is_increase', 'created_at', 'product__category')
+    list_select_related = ('product',)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
     search_fields = ('product__name', 'notes')
     ordering = ('-created_at',)
 
@@ -204,27 +232,28 @@ class StockTransactionAdmin(admin.ModelAdmin):
 
     def save_model(self, request, obj, form, change):
         if not change:  # Only for new transactions
-            obj.previous_stock = obj.product.stock_quantity
-            quantity_change = obj.quantity if obj.is_increase else -obj.quantity
-            obj.new_stock = obj.previous_stock + quantity_change
-            
-            # Validate the new stock level
-            if obj.new_stock < 0:
-                raise ValidationError('Cannot reduce stock below 0')
-            if obj.new_stock > obj.product.max_stock_level:
-                raise ValidationError(f'Cannot exceed maximum stock level of {obj.product.max_stock_level}')
-            
-            # Update the product's stock quantity
+            # The form checked the stock levels; the guarded UPDATE re-checks
+            # them against concurrent changes and the engine writes the ledger row
             with transaction.atomic():
-                obj.product.stock_quantity = obj.new_stock
-                obj.product.save()
-                obj.created_by = request.user
-                super().save_model(request, obj, form, change)
+                applied = stock.apply_stock_change(
+                    obj.product_id, obj.quantity if obj.is_increase else -obj.quantity
+                )
+                entry, = stock.record_stock_transactions(
+                    [applied], obj.transaction_type, notes=obj.notes, created_by=request.user
+                )
+            obj.pk = entry.pk
+            obj.previous_stock = entry.previous_stock
+            obj.new_stock = entry.new_stock
+            obj.created_by = entry.created_by
+            obj.created_at = entry.created_at
 
 @admin.register(ProductPriceHistory)
 class ProductPriceHistoryAdmin(admin.ModelAdmin):
     list_display = ('product', 'purchase_price', 'selling_price', 'changed_at')
     list_filter = ('product', 'changed_at')
+    list_select_related = ('product',)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
     search_fields = ('product__name',)
     readonly_fields = ('product', 'purchase_price', 'selling_price', 'changed_at', 'changed_by')
     ordering = ('-changed_at',)
@@ -238,10 +267,27 @@ class ProductPriceHistoryAdmin(admin.ModelAdmin):
     def has_delete_permission(self, request, obj=None):
         return False
 
+@admin.register(StockAlert)
+class StockAlertAdmin(admin.ModelAdmin):
+    list_display = ('product', 'stock_quantity', 'min_stock_level', 'status', 'attempts', 'created_at', 'sent_at')
+    list_filter = ('status', 'created_at')
+    list_select_related = ('product',)
+    search_fields = ('product__name',)
+    readonly_fields = ('product', 'stock_quantity', 'min_stock_level', 'status', 'attempts',
+                       'last_error', 'created_at', 'sent_at')
+    ordering = ('-created_at',)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
 @admin.register(SaleReturn)
 class SaleReturnAdmin(admin.ModelAdmin):
     list_display = ('sale_item', 'quantity', 'refund_amount', 'processed_at')
     list_filter = ('processed_at',)
+    list_select_related = ('sale_item__product', 'sale_item__sale')
     search_fields = ('sale_item__product__name', 'reason')
     readonly_fields = ('processed_at', 'refund_amount')
     ordering = ('-processed_at',)
@@ -258,23 +304,13 @@ class CustomerAdmin(admin.ModelAdmin):
 class SaleItemAdmin(admin.ModelAdmin):
     list_display = ('sale', 'product', 'quantity', 'price_at_sale')
     list_filter = ('sale__date',)
+    list_select_related = ('sale__customer', 'product')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
     search_fields = ('product__name', 'sale__customer__name')
     readonly_fields = ()
     ordering = ('-sale__date',)
 
     def delete_queryset(self, request, queryset):
-        """Override delete_queryset to handle bulk deletions properly"""
-        with transaction.atomic():
-            # First restore stock for all items
-            for item in queryset:
-                print(f"DEBUG: Bulk delete - Restoring {item.quantity} units of {item.product.name}")
-                actual_change = item.product.update_stock(
-                    item.quantity,
-                    transaction_type='ADJUSTMENT',
-                    notes=f'Restored from bulk sale item deletion'
-                )
-                if actual_change != item.quantity:
-                    print(f"DEBUG: Warning: Could not fully restore stock for {item.product.name}. Expected +{item.quantity}, actual +{actual_change}")
-            
-            # Then delete all items
-            queryset.delete() 
\ No newline at end of file
+        """Restore stock per product with set-based updates, then delete the items"""
+        services.delete_sale_items(queryset) 
\ No newline at end of file
@@ -0,0 +1,133 @@
+"""
+Low stock alert outbox.
+
+Write paths only insert ``StockAlert`` rows inside their own transaction;
+``process_pending_alerts`` (run by the ``process_alerts`` command) later
+coalesces them per product and emails digests in batches, so a sale never
+waits on SMTP.
+
+On backends that support ``SELECT ... FOR UPDATE SKIP LOCKED`` (PostgreSQL) a
+pass holds row locks on the alerts it picked, so several workers can run side
+by side without emailing the same alert twice. SQLite allows a single writer,
+so there a pass runs without a transaction instead of holding the write lock
+while it talks to the mail server.
+"""
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import connections, router, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import metrics
+from .models import StockAlert
+
+# Alerts that fail this many times are parked as FAILED.
+MAX_ATTEMPTS = 5
+
+
+def queue_low_stock_alerts(stock_changes):
+    """Queue one alert per ``StockChange`` that crossed its min_stock_level."""
+    alerts = [
+        StockAlert(
+            product_id=change.product_id,
+            stock_quantity=change.new_stock,
+            min_stock_level=change.min_stock_level,
+        )
+        for change in stock_changes
+        if change.needs_low_stock_alert
+    ]
+    if alerts:
+        StockAlert.objects.bulk_create(alerts)
+        metrics.alerts_queued.inc_on_commit(len(alerts))
+    return alerts
+
+
+def _digest_message(alerts):
+    if len(alerts) == 1:
+        subject = f'Low Stock Alert: {alerts[0].product.name}'
+    else:
+        subject = f'Low Stock Alert: {len(alerts)} products'
+    lines = ['The following products are at or below their minimum stock level:', '']
+    for alert in alerts:
+        lines.append(
+            f'- {alert.product.name}: {alert.stock_quantity} in stock '
+            f'(minimum {alert.min_stock_level})'
+        )
+    lines += ['', 'Please restock soon.']
+    return EmailMessage(
+        subject,
+        '\n'.join(lines),
+        settings.DEFAULT_FROM_EMAIL,
+        [settings.STOCK_ALERT_EMAIL],
+    )
+
+
+def process_pending_alerts(window=None, batch_size=None, connection=None):
+    """
+    Deliver pending alerts and return ``(sent, failed)`` counts of products.
+
+    Pending alerts are coalesced per product into the most recent one. A
+    product that was already alerted within ``window`` stays pending until
+    the window has passed, so a run of sales produces one email instead of
+    one per sale. Each email covers up to ``batch_size`` products.
+    """
+    if window is None:
+        window = timedelta(minutes=settings.STOCK_ALERT_COALESCE_MINUTES)
+    batch_size = batch_size or settings.STOCK_ALERT_BATCH_SIZE
+    using = router.db_for_write(StockAlert)
+    if connections[using].features.has_select_for_update_skip_locked:
+        with transaction.atomic(using=using):
+            return _process(window, batch_size, connection, skip_locked=True)
+    return _process(window, batch_size, connection)
+
+
+def _process(window, batch_size, connection, skip_locked=False):
+    now = timezone.now()
+
+    recently_alerted = set(
+        StockAlert.objects.filter(status='SENT', sent_at__gte=now - window)
+        .values_list('product_id', flat=True)
+    )
+    pending = (
+        StockAlert.objects.filter(status='PENDING')
+        .exclude(product_id__in=recently_alerted)
+        .select_related('product')
+        .order_by('product_id', '-created_at', '-id')
+    )
+    if skip_locked:
+        # Lock only the alerts: sales keep updating the products meanwhile
+        pending = pending.select_for_update(skip_locked=True, of=('self',))
+
+    # Latest alert per product, plus every alert id it stands in for
+    latest = {}
+    covered = {}
+    for alert in pending:
+        latest.setdefault(alert.product_id, alert)
+        covered.setdefault(alert.product_id, []).append(alert.pk)
+
+    alerts = sorted(latest.values(), key=lambda alert: alert.product.name)
+    connection = connection or get_connection()
+    sent = failed = 0
+    for start in range(0, len(alerts), batch_size):
+        batch = alerts[start:start + batch_size]
+        ids = [pk for alert in batch for pk in covered[alert.product_id]]
+        try:
+            connection.send_messages([_digest_message(batch)])
+        except Exception as e:
+            rows = StockAlert.objects.filter(pk__in=ids, status='PENDING')
+            rows.update(attempts=F('attempts') + 1, last_error=str(e))
+            rows.filter(attempts__gte=MAX_ATTEMPTS).update(status='FAILED')
+            failed += len(batch)
+        else:
+            StockAlert.objects.filter(pk__in=ids, status='PENDING').update(
+                status='SENT', sent_at=now
+            )
+            sent += len(batch)
+    if sent:
+        metrics.alerts_delivered.inc_on_commit(sent, result='sent')
+    if failed:
+        metrics.alerts_delivered.inc_on_commit(failed, result='failed')
+    return sent, failed
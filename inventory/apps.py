@@ -0,0 +1,13 @@
+from django.apps import AppConfig
+from django.db.backends.signals import connection_created
+
+
+class InventoryConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'inventory'
+
+    def ready(self):
+        from . import slowqueries
+        from .sqlite import configure_connection
+        connection_created.connect(configure_connection, dispatch_uid='inventory.sqlite.configure_connection')
+        connection_created.connect(slowqueries.install, dispatch_uid='inventory.slowqueries.install')
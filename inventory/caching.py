@@ -0,0 +1,168 @@
+"""
+Versioned cache for the dashboard chart endpoints.
+
+Responses are cached under their chart tag: a digest of the endpoint, the
+normalized query parameters, the date, the data version and
+``data_watermark()``. The data version is a counter in the chart cache that
+every write to sales, stock or products bumps once its transaction commits;
+the watermark is a handful of MAX() lookups that move on every sale, stock
+movement and product or customer change, so another worker's writes are
+noticed even when the version counter is not shared (the per-process
+``locmem`` backend). A write invalidates every cached chart at once and
+nothing has to be deleted.
+
+The same tag is the ETag of the chart endpoints, so a cached body is always
+served under the tag it was computed for and conditional requests are
+answered with 304 only while the data is unchanged.
+"""
+
+import hashlib
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connections, router, transaction
+from django.http import HttpResponse
+from django.utils import timezone
+
+VERSION_KEY = 'inventory:data-version'
+HITS_KEY = 'inventory:chart-cache:hits'
+MISSES_KEY = 'inventory:chart-cache:misses'
+
+
+def chart_cache():
+    return caches[settings.CHART_CACHE_ALIAS]
+
+
+def _incr(cache, key):
+    try:
+        return cache.incr(key)
+    except ValueError:
+        # Missing (or evicted) counter; add() keeps a concurrent incr intact
+        if not cache.add(key, 1, timeout=None):
+            return cache.incr(key)
+        return 1
+
+
+def data_version():
+    """The current data version; starts at 1."""
+    cache = chart_cache()
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, 1, timeout=None)
+        version = cache.get(VERSION_KEY, 1)
+    return version
+
+
+def bump_data_version():
+    """Invalidate every cached chart once the current transaction commits."""
+    transaction.on_commit(lambda: _incr(chart_cache(), VERSION_KEY))
+
+
+def _digest(params, *extra):
+    normalized = sorted(
+        (name, value.strip())
+        for name in params
+        for value in params.getlist(name)
+        if value.strip()
+    )
+    return hashlib.md5(repr((normalized,) + extra).encode()).hexdigest()
+
+
+def chart_tag(request, endpoint):
+    """
+    The ETag and cache key of ``endpoint`` for ``request``; computed once per
+    request, so the conditional check and the cache lookup agree.
+    """
+    tags = request.__dict__.setdefault('_chart_tags', {})
+    if endpoint not in tags:
+        # The date is part of the tag because the day windows move at midnight
+        tags[endpoint] = _digest(
+            request.GET, endpoint, timezone.localdate(), data_version(), data_watermark())
+    return tags[endpoint]
+
+
+def cache_key(endpoint, tag):
+    return f'inventory:chart:{endpoint}:{tag}'
+
+
+def cache_stats():
+    """Hit and miss counters of the chart cache."""
+    cache = chart_cache()
+    return {
+        'hits': cache.get(HITS_KEY, 0),
+        'misses': cache.get(MISSES_KEY, 0),
+        'version': data_version(),
+    }
+
+
+def _watermark_columns():
+    """(model, column) pairs; a None column counts the rows instead."""
+    from .models import Category, Customer, DailyProductSales, Product, Sale, StockTransaction
+    return [
+        (StockTransaction, 'id'),
+        (Sale, 'id'),
+        (Product, 'updated_at'),
+        (Customer, 'id'),
+        (DailyProductSales, 'id'),
+        # Categories are few: the latest edit catches renames, the count deletions
+        (Category, 'updated_at'),
+        (Category, None),
+    ]
+
+
+def data_watermark():
+    """
+    A tuple that changes whenever the data behind the charts changes, read
+    with one query of indexed MAX() lookups.
+    """
+    columns = _watermark_columns()
+    connection = connections[router.db_for_read(columns[0][0])]
+    qn = connection.ops.quote_name
+    selects = ', '.join(
+        '(SELECT {aggregate} FROM {table})'.format(
+            aggregate=f'MAX({qn(model._meta.get_field(name).column)})' if name else 'COUNT(*)',
+            table=qn(model._meta.db_table))
+        for model, name in columns
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(f'SELECT {selects}')
+        return tuple(cursor.fetchone())
+
+
+def chart_etag(endpoint):
+    """
+    Build an ``etag_func`` for ``django.views.decorators.http.condition`` so a
+    chart whose data has not changed is answered with 304 before any
+    aggregation (or cache lookup) runs.
+    """
+    def etag(request, *args, **kwargs):
+        return chart_tag(request, endpoint)
+    return etag
+
+
+def cached_chart(endpoint):
+    """
+    Cache successful JSON responses of a chart view under its chart tag.
+    Responses carry an X-Cache header with HIT or MISS.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            cache = chart_cache()
+            key = cache_key(endpoint, chart_tag(request, endpoint))
+            content = cache.get(key)
+            if content is not None:
+                _incr(cache, HITS_KEY)
+                response = HttpResponse(content, content_type='application/json')
+                response['X-Cache'] = 'HIT'
+                return response
+
+            _incr(cache, MISSES_KEY)
+            response = view(request, *args, **kwargs)
+            if response.status_code == 200:
+                cache.set(key, response.content, settings.CHART_CACHE_TIMEOUT)
+            response['X-Cache'] = 'MISS'
+            return response
+        return wrapper
+    return decorator
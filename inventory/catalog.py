@@ -0,0 +1,103 @@
+"""
+Barcode catalog for the POS.
+
+The POS page loads a snapshot of every barcoded product once and resolves
+scans from memory. It then polls ``changes_since`` with the version of its
+copy; the version is the latest ``Product.updated_at`` (in microseconds since
+the epoch) and every product write, including the stock engine's UPDATEs,
+moves it.
+
+Deleting a barcoded product leaves a ``DeletedProduct`` tombstone, which moves
+the version too and is sent in ``removed``. Tombstones are kept for
+``TOMBSTONE_RETENTION``; a client whose version is older gets the full
+snapshot instead. Every response also carries the number of barcoded
+products, and a client whose copy has a different size reloads the snapshot.
+"""
+
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.db.models import Count, Max, Q
+from django.utils import timezone
+
+from .models import DeletedProduct, Product
+
+# Rows written by a transaction that commits after a poll carry an updated_at
+# earlier than the commit; re-sending a short window catches them.
+SYNC_OVERLAP = timedelta(seconds=60)
+
+TOMBSTONE_RETENTION = timedelta(days=7)
+
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+FIELDS = ('id', 'barcode', 'name', 'selling_price', 'stock_quantity', 'image')
+
+NO_BARCODE = Q(barcode__isnull=True) | Q(barcode='')
+
+
+def to_version(moment):
+    return (moment - EPOCH) // timedelta(microseconds=1) if moment else 0
+
+
+def from_version(version):
+    return EPOCH + timedelta(microseconds=version)
+
+
+def watermark():
+    """(version, number of barcoded products) in two queries."""
+    state = Product.objects.exclude(NO_BARCODE).aggregate(
+        latest=Max('updated_at'), count=Count('pk'),
+    )
+    deleted = DeletedProduct.objects.aggregate(latest=Max('deleted_at'))['latest']
+    return to_version(max(filter(None, (state['latest'], deleted)), default=None)), state['count']
+
+
+def record_deletion(product):
+    """Leave a tombstone for ``product`` if it had a barcode, pruning expired ones."""
+    if product.barcode:
+        DeletedProduct.objects.filter(deleted_at__lt=timezone.now() - TOMBSTONE_RETENTION).delete()
+        DeletedProduct.objects.create(product_id=product.pk)
+
+
+def _entries(products):
+    storage = Product._meta.get_field('image').storage
+    return {
+        row['barcode']: {
+            'id': row['id'],
+            'name': row['name'],
+            'price': float(row['selling_price']),
+            'stock': row['stock_quantity'],
+            'image_url': storage.url(row['image']) if row['image'] else None,
+        }
+        for row in products.values(*FIELDS)
+    }
+
+
+def snapshot():
+    """Every barcoded product as ``{barcode: {id, name, price, stock, image_url}}``."""
+    version, count = watermark()
+    products = Product.objects.exclude(NO_BARCODE)
+    return {'version': version, 'count': count, 'full': True, 'products': _entries(products)}
+
+
+def changes_since(version):
+    """
+    Products changed since ``version``. ``removed`` lists the ids of products
+    deleted since then or changed to have no barcode; clients drop them by id
+    before applying ``products``. Versions older than the tombstones kept get
+    the full snapshot.
+    """
+    since = from_version(version) - SYNC_OVERLAP
+    if since < timezone.now() - TOMBSTONE_RETENTION:
+        return snapshot()
+    current, count = watermark()
+    changed = Product.objects.filter(updated_at__gte=since)
+    removed = list(changed.filter(NO_BARCODE).values_list('pk', flat=True))
+    removed += DeletedProduct.objects.filter(deleted_at__gte=since).values_list('product_id', flat=True)
+    products = changed.exclude(NO_BARCODE)
+    return {
+        'version': max(current, version),
+        'count': count,
+        'full': False,
+        'products': _entries(products),
+        'removed': removed,
+    }
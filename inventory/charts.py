@@ -0,0 +1,280 @@
+"""
+Dataset builders for the admin dashboard charts.
+
+Each builder returns the Chart.js ``{'labels': ..., 'datasets': ...}`` dict for
+one chart. ``dashboard_data`` builds several of them at once and lets charts
+that read the same rows share a single query.
+"""
+
+from datetime import timedelta
+
+from django.db.models import Count, F, Q, Sum
+from django.utils import timezone
+
+from .instrumentation import timed
+from .models import Customer, DailyCategorySales, DailyProductSales, Product
+
+CHARTS = ('stockLevels', 'topSelling', 'salesProfit', 'stockStatus', 'newCustomers', 'salesByCategory')
+
+TOP_SELLING_COLORS = [
+    ('rgba(255, 99, 132, 0.5)', 'rgba(255, 99, 132, 1)'),
+    ('rgba(54, 162, 235, 0.5)', 'rgba(54, 162, 235, 1)'),
+    ('rgba(255, 206, 86, 0.5)', 'rgba(255, 206, 86, 1)'),
+    ('rgba(75, 192, 192, 0.5)', 'rgba(75, 192, 192, 1)'),
+    ('rgba(153, 102, 255, 0.5)', 'rgba(153, 102, 255, 1)'),
+]
+
+
+def _start_date(days):
+    return timezone.localdate() - timedelta(days=days)
+
+
+def active_stock_rows(search=''):
+    """Name, stock and minimum level of active products, ordered by name."""
+    products = Product.objects.filter(is_active=True)
+    if search:
+        products = products.filter(name__icontains=search)
+    return list(products.values('name', 'stock_quantity', 'min_stock_level').order_by('name'))
+
+
+def category_rollup_rows(days):
+    """Revenue and profit per (day, category) for the last ``days`` days."""
+    return list(
+        DailyCategorySales.objects.filter(date__gte=_start_date(days))
+        .values('date', 'category__name')
+        .annotate(total_sales=Sum('revenue'), total_profit=Sum('profit'))
+        .order_by('date')
+    )
+
+
+@timed('chart.stock_levels')
+def stock_levels(search='', rows=None):
+    """Bar chart showing current stock levels vs min stock levels for all products"""
+    if rows is None:
+        rows = active_stock_rows(search)
+
+    return {
+        'labels': [p['name'] for p in rows],
+        'datasets': [
+            {
+                'label': 'Current Stock',
+                'data': [p['stock_quantity'] for p in rows],
+                'backgroundColor': 'rgba(54, 162, 235, 0.5)',
+                'borderColor': 'rgba(54, 162, 235, 1)',
+                'borderWidth': 1
+            },
+            {
+                'label': 'Minimum Stock Level',
+                'data': [p['min_stock_level'] for p in rows],
+                'backgroundColor': 'rgba(255, 99, 132, 0.5)',
+                'borderColor': 'rgba(255, 99, 132, 1)',
+                'borderWidth': 1
+            }
+        ]
+    }
+
+
+@timed('chart.top_selling')
+def top_selling(days=30, category_id=None, search=''):
+    """Bar chart showing top 5 selling products by quantity"""
+    # Read the daily product rollups instead of scanning sale items
+    query = DailyProductSales.objects.filter(
+        date__gte=_start_date(days),
+        product__is_active=True
+    )
+
+    if category_id:
+        query = query.filter(product__category_id=category_id)
+
+    if search:
+        query = query.filter(product__name__icontains=search)
+
+    # Group by product name and sum quantities
+    top_products = query.values(
+        'product__name'
+    ).annotate(
+        total_quantity=Sum('units')
+    ).filter(
+        # Rollup rows netted to zero by returns or deletions are not sales
+        total_quantity__gt=0
+    ).order_by('-total_quantity')[:5]
+
+    return {
+        'labels': [p['product__name'] for p in top_products],
+        'datasets': [{
+            'label': 'Units Sold',
+            'data': [p['total_quantity'] for p in top_products],
+            'backgroundColor': [background for background, _ in TOP_SELLING_COLORS],
+            'borderColor': [border for _, border in TOP_SELLING_COLORS],
+            'borderWidth': 1
+        }]
+    }
+
+
+@timed('chart.sales_profit')
+def sales_profit(days=30, rows=None):
+    """Line chart showing sales and profit over time"""
+    if rows is None:
+        rows = category_rollup_rows(days)
+
+    totals = {}
+    for row in rows:
+        sales, profit = totals.get(row['date'], (0, 0))
+        totals[row['date']] = (sales + row['total_sales'], profit + row['total_profit'])
+    dates = sorted(totals)
+
+    return {
+        'labels': [str(day) for day in dates],
+        'datasets': [
+            {
+                'label': 'Sales',
+                'data': [float(totals[day][0]) for day in dates],
+                'borderColor': 'rgba(54, 162, 235, 1)',
+                'backgroundColor': 'rgba(54, 162, 235, 0.1)',
+                'fill': True
+            },
+            {
+                'label': 'Profit',
+                'data': [float(totals[day][1]) for day in dates],
+                'borderColor': 'rgba(75, 192, 192, 1)',
+                'backgroundColor': 'rgba(75, 192, 192, 0.1)',
+                'fill': True
+            }
+        ]
+    }
+
+
+@timed('chart.stock_status')
+def stock_status(rows=None):
+    """Pie chart showing stock status distribution"""
+    if rows is None:
+        # One conditional aggregation instead of a COUNT per status
+        counts = Product.objects.filter(is_active=True).aggregate(
+            out_of_stock=Count('pk', filter=Q(stock_quantity=0)),
+            low_stock=Count('pk', filter=Q(stock_quantity__gt=0, stock_quantity__lte=F('min_stock_level'))),
+            in_stock=Count('pk', filter=Q(stock_quantity__gt=F('min_stock_level'))),
+        )
+    else:
+        counts = {'out_of_stock': 0, 'low_stock': 0, 'in_stock': 0}
+        for p in rows:
+            if p['stock_quantity'] == 0:
+                counts['out_of_stock'] += 1
+            elif p['stock_quantity'] <= p['min_stock_level']:
+                counts['low_stock'] += 1
+            else:
+                counts['in_stock'] += 1
+
+    return {
+        'labels': ['Out of Stock', 'Low Stock', 'In Stock'],
+        'datasets': [{
+            'data': [counts['out_of_stock'], counts['low_stock'], counts['in_stock']],
+            'backgroundColor': [
+                'rgba(255, 99, 132, 0.5)',
+                'rgba(255, 206, 86, 0.5)',
+                'rgba(75, 192, 192, 0.5)'
+            ],
+            'borderColor': [
+                'rgba(255, 99, 132, 1)',
+                'rgba(255, 206, 86, 1)',
+                'rgba(75, 192, 192, 1)'
+            ],
+            'borderWidth': 1
+        }]
+    }
+
+
+@timed('chart.new_customers')
+def new_customers(days=30):
+    """Line chart showing new customer acquisitions over time"""
+    start_date = timezone.now() - timedelta(days=days)
+
+    customers = Customer.objects.filter(
+        created_at__gte=start_date
+    ).values('created_at__date').annotate(
+        count=Count('id')
+    ).order_by('created_at__date')
+
+    return {
+        'labels': [str(entry['created_at__date']) for entry in customers],
+        'datasets': [{
+            'label': 'New Customers',
+            'data': [entry['count'] for entry in customers],
+            'borderColor': 'rgba(153, 102, 255, 1)',
+            'backgroundColor': 'rgba(153, 102, 255, 0.1)',
+            'fill': True
+        }]
+    }
+
+
+@timed('chart.sales_by_category')
+def sales_by_category(days=30, rows=None):
+    """Bar chart showing sales distribution by category"""
+    if rows is None:
+        rows = category_rollup_rows(days)
+
+    totals = {}
+    for row in rows:
+        name = row['category__name'] or 'Uncategorized'
+        totals[name] = totals.get(name, 0) + row['total_sales']
+    # Categories whose sales were all returned or deleted net to zero
+    ranked = sorted(((name, total) for name, total in totals.items() if total > 0),
+                    key=lambda item: item[1], reverse=True)
+
+    return {
+        'labels': [name for name, _ in ranked],
+        'datasets': [{
+            'label': 'Sales by Category',
+            'data': [float(total) for _, total in ranked],
+            'backgroundColor': 'rgba(54, 162, 235, 0.5)',
+            'borderColor': 'rgba(54, 162, 235, 1)',
+            'borderWidth': 1
+        }]
+    }
+
+
+@timed('chart.dashboard')
+def dashboard_data(params, charts=CHARTS):
+    """
+    Build the datasets for ``charts`` from ``params`` (a QueryDict using the
+    ``<chart>_<param>`` naming of the dashboard endpoint, e.g. ``topSelling_days``).
+
+    Stock levels and stock status share one product query when no search is
+    applied, and sales/profit and sales by category share one rollup query
+    when they cover the same number of days.
+    """
+    def param(chart, name, default=''):
+        return params.get(f'{chart}_{name}', default).strip()
+
+    def days(chart):
+        return int(param(chart, 'days', '30') or 30)
+
+    data = {}
+    stock_search = param('stockLevels', 'search')
+    shared_stock_rows = None
+    if 'stockLevels' in charts and 'stockStatus' in charts and not stock_search:
+        shared_stock_rows = active_stock_rows()
+
+    rollup_rows = {}
+
+    def rollups_for(day_count):
+        if day_count not in rollup_rows:
+            rollup_rows[day_count] = category_rollup_rows(day_count)
+        return rollup_rows[day_count]
+
+    if 'stockLevels' in charts:
+        data['stockLevels'] = stock_levels(stock_search, rows=shared_stock_rows)
+    if 'topSelling' in charts:
+        data['topSelling'] = top_selling(
+            days=days('topSelling'),
+            category_id=param('topSelling', 'category') or None,
+            search=param('topSelling', 'search'),
+        )
+    if 'salesProfit' in charts:
+        data['salesProfit'] = sales_profit(rows=rollups_for(days('salesProfit')))
+    if 'stockStatus' in charts:
+        data['stockStatus'] = stock_status(rows=shared_stock_rows)
+    if 'newCustomers' in charts:
+        data['newCustomers'] = new_customers(days=days('newCustomers'))
+    if 'salesByCategory' in charts:
+        data['salesByCategory'] = sales_by_category(rows=rollups_for(days('salesByCategory')))
+    return data
@@ -1,5 +1,5 @@
 from django import forms
-from .models import Product, Customer, Sale, SaleItem
+from .models import Product, Customer, Sale, SaleItem, StockTransaction
 
 class ProductForm(forms.ModelForm):
     class Meta:
@@ -57,4 +57,25 @@ class SaleForm(forms.ModelForm):
     def add_sale_item_form(self, data=None):
         form = SaleItemForm(data)
         self.sale_item_forms.append(form)
-        return form 
\ No newline at end of file
+        return form 
+
+class StockTransactionForm(forms.ModelForm):
+    """Manual stock transaction, checked against the product's current stock."""
+    class Meta:
+        model = StockTransaction
+        fields = ['product', 'transaction_type', 'quantity', 'is_increase', 'notes']
+
+    def clean(self):
+        cleaned_data = super().clean()
+        product = cleaned_data.get('product')
+        quantity = cleaned_data.get('quantity')
+        if self.instance.pk or product is None or quantity is None:
+            return cleaned_data
+
+        current_stock = product.stock_quantity
+        new_stock = current_stock + (quantity if cleaned_data.get('is_increase') else -quantity)
+        if new_stock < 0:
+            self.add_error('quantity', f'Cannot reduce stock below 0. Current stock: {current_stock}')
+        elif new_stock > product.max_stock_level:
+            self.add_error('quantity', f'Cannot exceed maximum stock level of {product.max_stock_level}')
+        return cleaned_data
@@ -0,0 +1,72 @@
+"""
+Per-product stock movement history, paginated by keyset.
+
+Pages are ordered newest first by ``(created_at, id)`` and continue from an
+opaque cursor holding the last row's position, so every page is an index range
+scan on ``stocktx_product_created_idx`` however deep the client pages, unlike
+``OFFSET`` which re-reads every skipped row.
+"""
+
+import base64
+from datetime import datetime
+
+from django.db.models import Q
+
+from .models import StockTransaction
+
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+FIELDS = ('id', 'transaction_type', 'quantity', 'is_increase', 'previous_stock', 'new_stock',
+          'notes', 'created_at', 'created_by__username')
+
+
+def encode_cursor(created_at, pk):
+    return base64.urlsafe_b64encode(f'{created_at.isoformat()}|{pk}'.encode()).decode()
+
+
+def decode_cursor(cursor):
+    """Return ``(created_at, id)`` from a cursor; raises ``ValueError`` if it is malformed."""
+    try:
+        created_at, pk = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+        return datetime.fromisoformat(created_at), int(pk)
+    except (TypeError, ValueError) as e:
+        raise ValueError('Invalid cursor') from e
+
+
+def stock_history(product_id, cursor=None, limit=PAGE_SIZE, transaction_type=None, since=None, until=None):
+    """
+    One page of ``product_id``'s stock transactions, newest first, optionally
+    restricted to a ``transaction_type`` and to ``since <= created_at < until``.
+    ``next_cursor`` is None on the last page.
+    """
+    transactions = StockTransaction.objects.filter(product_id=product_id)
+    if transaction_type:
+        transactions = transactions.filter(transaction_type=transaction_type)
+    if since is not None:
+        transactions = transactions.filter(created_at__gte=since)
+    if until is not None:
+        transactions = transactions.filter(created_at__lt=until)
+    if cursor:
+        created_at, pk = decode_cursor(cursor)
+        transactions = transactions.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, pk__lt=pk))
+
+    rows = list(transactions.order_by('-created_at', '-id').values(*FIELDS)[:limit + 1])
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    return {
+        'results': [
+            {
+                'id': row['id'],
+                'transaction_type': row['transaction_type'],
+                'quantity': row['quantity'] if row['is_increase'] else -row['quantity'],
+                'previous_stock': row['previous_stock'],
+                'new_stock': row['new_stock'],
+                'notes': row['notes'],
+                'created_at': row['created_at'].isoformat(),
+                'created_by': row['created_by__username'],
+            }
+            for row in rows
+        ],
+        'next_cursor': encode_cursor(rows[-1]['created_at'], rows[-1]['id']) if has_more else None,
+    }
@@ -0,0 +1,102 @@
+"""
+Timing spans for the hot paths.
+
+``span`` times a block and ``timed`` a function; both log to the
+``inventory.timing`` logger at INFO. They are switched on and off by that
+logger's level (``TIMING_LOG_LEVEL`` in settings): while INFO is disabled a
+span is one cached level check returning a shared no-op context manager, so
+they can stay in production code paths.
+
+When timing is on, ``inventory.middleware.TimingMiddleware`` also collects
+the spans of each request and logs one summary line per request, with the
+total time spent under each span name.
+"""
+
+import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+timing_logger = logging.getLogger('inventory.timing')
+
+# Spans finished inside collect_spans(), e.g. during a request
+_request_spans = ContextVar('request_spans', default=None)
+
+
+def timing_enabled():
+    return timing_logger.isEnabledFor(logging.INFO)
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    __slots__ = ('name', 'fields', 'start')
+
+    def __init__(self, name, fields):
+        self.name = name
+        self.fields = fields
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = (time.perf_counter() - self.start) * 1000
+        spans = _request_spans.get()
+        if spans is not None:
+            spans.append((self.name, elapsed))
+        fields = ''.join(f' {key}={value}' for key, value in self.fields.items())
+        timing_logger.info('%s %.2fms%s%s', self.name, elapsed, fields, ' failed' if exc_type else '')
+        return False
+
+
+def span(name, **fields):
+    """Time the ``with`` block under ``name``; ``fields`` are added to the log line."""
+    if not timing_logger.isEnabledFor(logging.INFO):
+        return _NULL_SPAN
+    return _Span(name, fields)
+
+
+def timed(name):
+    """Decorator timing every call of the function as a span called ``name``."""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if not timing_logger.isEnabledFor(logging.INFO):
+                return func(*args, **kwargs)
+            with _Span(name, {}):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+@contextmanager
+def collect_spans():
+    """Collect the spans finished inside the block into the yielded list of ``(name, ms)``."""
+    spans = []
+    token = _request_spans.set(spans)
+    try:
+        yield spans
+    finally:
+        _request_spans.reset(token)
+
+
+def summarize(spans):
+    """``{name: (count, total ms)}`` for a list of collected spans."""
+    totals = {}
+    for name, elapsed in spans:
+        count, total = totals.get(name, (0, 0.0))
+        totals[name] = (count + 1, total + elapsed)
+    return totals
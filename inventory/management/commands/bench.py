@@ -0,0 +1,360 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connections, transaction
+from django.test.utils import (
+    override_settings, setup_databases, setup_test_environment, teardown_databases,
+    teardown_test_environment,
+)
+from django.urls import reverse
+from django.utils import timezone
+from datetime import datetime, time as dt_time, timedelta
+from decimal import Decimal
+import django
+import json
+import multiprocessing
+import os
+import random
+import subprocess
+import tempfile
+import time
+
+from inventory import metrics
+from inventory.querystats import QueryCounter, count_queries
+
+CATEGORIES = 12
+BASKET_SIZES = (1, 5, 20)
+DAY_WINDOWS = (7, 30, 90, 365)
+CHARTS = {
+    'chart_stock_levels': False,
+    'chart_top_selling': True,
+    'chart_sales_profit': True,
+    'chart_stock_status': False,
+    'chart_new_customers': True,
+    'chart_sales_by_category': True,
+}
+CHANGELISTS = ('product', 'sale', 'stocktransaction')
+# Products shared by the concurrent update_stock workers, so they contend
+HOT_PRODUCTS = 5
+
+def _percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[max(0, -(-len(ordered) * pct // 100) - 1)]
+
+def _summary(durations, queries, elapsed=None):
+    """Latency percentiles in milliseconds, throughput and query counts of one benchmark."""
+    return {
+        'iterations': len(durations),
+        'p50_ms': round(_percentile(durations, 50) * 1000, 3),
+        'p95_ms': round(_percentile(durations, 95) * 1000, 3),
+        'p99_ms': round(_percentile(durations, 99) * 1000, 3),
+        'mean_ms': round(sum(durations) / len(durations) * 1000, 3),
+        'ops_per_second': round(len(durations) / (elapsed or sum(durations)), 1),
+        'queries': {'p50': _percentile(queries, 50), 'max': max(queries)},
+    }
+
+def _measure(operation, iterations):
+    """Run ``operation`` ``iterations`` times, returning (durations, query counts)."""
+    durations, queries = [], []
+    for _ in range(iterations):
+        counter = QueryCounter()
+        with count_queries(counter):
+            started = time.perf_counter()
+            operation()
+            durations.append(time.perf_counter() - started)
+        queries.append(counter.queries)
+    return durations, queries
+
+def _git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=settings.BASE_DIR, capture_output=True,
+                              text=True, timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+def _stock_worker(product_ids, iterations, seed, results):
+    from inventory.models import Product
+
+    connections.close_all()
+    rng = random.Random(seed)
+    products = list(Product.objects.filter(pk__in=product_ids))
+    stats = {'durations': [], 'queries': [], 'locked': 0, 'errors': 0}
+    for _ in range(iterations):
+        product = rng.choice(products)
+        counter = QueryCounter()
+        started = time.perf_counter()
+        try:
+            with count_queries(counter):
+                product.update_stock(rng.choice((-1, 1)), notes='bench')
+        except OperationalError as e:
+            stats['locked' if 'locked' in str(e) else 'errors'] += 1
+            continue
+        except Exception:
+            stats['errors'] += 1
+            continue
+        stats['durations'].append(time.perf_counter() - started)
+        stats['queries'].append(counter.queries)
+    connections.close_all()
+    results.put(stats)
+
+class Command(BaseCommand):
+    help = ('Build a synthetic dataset in a throwaway database and time the inventory hot paths; '
+            'prints JSON with latency percentiles and query counts')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=1000, help='Products in the catalog (default: 1000)')
+        parser.add_argument('--customers', type=int, default=2000, help='Customers (default: 2000)')
+        parser.add_argument('--years', type=float, default=2, help='Years of sales history (default: 2)')
+        parser.add_argument('--sales-per-day', type=int, default=40,
+                            help='Average sales per day of history (default: 40)')
+        parser.add_argument('--iterations', type=int, default=30,
+                            help='Timed runs per operation (default: 30)')
+        parser.add_argument('--workers', type=int, default=4,
+                            help='Concurrent processes for the update_stock benchmark (default: 4)')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed for the dataset (default: 0)')
+        parser.add_argument('--output', default=None, help='Write the JSON report to this file instead of stdout')
+
+    def handle(self, *args, **options):
+        if options['iterations'] < 1:
+            raise CommandError('--iterations must be at least 1')
+        if options['products'] < max(BASKET_SIZES + (HOT_PRODUCTS,)):
+            raise CommandError(f'--products must be at least {max(BASKET_SIZES + (HOT_PRODUCTS,))}')
+
+        with tempfile.TemporaryDirectory() as directory:
+            # Time production settings and never touch the real stats, metrics or slow query log
+            with override_settings(
+                DEBUG=False,
+                METRICS_DIR=os.path.join(directory, 'metrics'),
+                ENDPOINT_STATS_DIR=os.path.join(directory, 'endpoint-stats'),
+                SLOW_QUERY_LOG_ENABLED=False,
+            ):
+                try:
+                    report = self._run_in_scratch_database(directory, options)
+                finally:
+                    # Keep the benchmark's sales out of the real metrics
+                    metrics.reset()
+
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                f.write(output + '\n')
+            self.stderr.write(f'Wrote {options["output"]}')
+        else:
+            self.stdout.write(output)
+
+    def _run_in_scratch_database(self, directory, options):
+        default = connections['default']
+        if default.vendor == 'sqlite':
+            # A file, not :memory:, so the forked workers share it
+            default.settings_dict.setdefault('TEST', {})['NAME'] = os.path.join(directory, 'bench.sqlite3')
+        started_at = timezone.now()
+        setup_test_environment()
+        old_config = setup_databases(verbosity=0, interactive=False, aliases={'default'})
+        try:
+            rng = random.Random(options['seed'])
+            started = time.perf_counter()
+            dataset = self._build_dataset(rng, options)
+            dataset['build_seconds'] = round(time.perf_counter() - started, 2)
+            self.stderr.write(f'Built dataset in {dataset["build_seconds"]}s: {dataset}')
+
+            results = {}
+            results.update(self._bench_create_sale(rng, options))
+            results.update(self._bench_update_stock(options))
+            results.update(self._bench_charts(options))
+            results.update(self._bench_barcode(rng, options))
+            results.update(self._bench_changelists(options))
+        finally:
+            connections.close_all()
+            teardown_databases(old_config, verbosity=0)
+            teardown_test_environment()
+
+        return {
+            'meta': {
+                'revision': _git_revision(),
+                'started_at': started_at.isoformat(),
+                'django': django.get_version(),
+                'database': default.vendor,
+                'options': {name: options[name] for name in
+                            ('products', 'customers', 'years', 'sales_per_day', 'iterations', 'workers', 'seed')},
+            },
+            'dataset': dataset,
+            'results': results,
+        }
+
+    def _build_dataset(self, rng, options):
+        from inventory import rollups
+        from inventory.models import Category, Customer, Product, Sale, SaleItem, StockTransaction
+
+        now = timezone.now()
+        days = max(1, int(options['years'] * 365))
+        with transaction.atomic():
+            categories = Category.objects.bulk_create([
+                Category(name=f'Benchmark category {i}') for i in range(CATEGORIES)
+            ])
+            products = []
+            for i in range(options['products']):
+                purchase_price = Decimal(rng.randint(100, 10000)) / 100
+                products.append(Product(
+                    name=f'Benchmark product {i:05d}', category=categories[i % CATEGORIES],
+                    purchase_price=purchase_price, selling_price=(purchase_price * Decimal('1.35')).quantize(Decimal('0.01')),
+                    stock_quantity=10 ** 6, min_stock_level=10, max_stock_level=10 ** 7,
+                    low_stock_alert=False, barcode=f'BENCH{i:08d}',
+                ))
+            Product.objects.bulk_create(products, batch_size=500)
+            products = list(Product.objects.order_by('pk'))
+            Customer.objects.bulk_create([
+                Customer(name=f'Customer {i}', contact_info=f'customer{i}@example.com',
+                         created_at=now - timedelta(days=rng.randint(0, days), seconds=rng.randint(0, 86399)))
+                for i in range(options['customers'])
+            ], batch_size=500)
+            customer_ids = list(Customer.objects.values_list('pk', flat=True))
+
+            sale_count = item_count = 0
+            for day in range(days, -1, -1):
+                moment = timezone.make_aware(datetime.combine(timezone.localdate(now) - timedelta(days=day), dt_time(12)))
+                baskets = [
+                    [(product, rng.randint(1, 3)) for product in rng.sample(products, rng.randint(1, 5))]
+                    for _ in range(rng.randint(options['sales_per_day'] // 2, options['sales_per_day'] * 3 // 2))
+                ]
+                if not baskets:
+                    continue
+                sales = Sale.objects.bulk_create([
+                    Sale(
+                        customer_id=rng.choice(customer_ids) if customer_ids else None, is_paid=True,
+                        total_amount=sum(product.selling_price * quantity for product, quantity in basket),
+                        profit=sum((product.selling_price - product.purchase_price) * quantity
+                                   for product, quantity in basket),
+                    )
+                    for basket in baskets
+                ])
+                items = [
+                    SaleItem(sale=sale, product=product, quantity=quantity, price_at_sale=product.selling_price,
+                             purchase_price_at_sale=product.purchase_price)
+                    for sale, basket in zip(sales, baskets)
+                    for product, quantity in basket
+                ]
+                SaleItem.objects.bulk_create(items, batch_size=500)
+                ledger = StockTransaction.objects.bulk_create([
+                    StockTransaction(product=item.product, quantity=item.quantity, is_increase=False,
+                                     transaction_type='SALE', notes=f'Sale #{item.sale.pk}',
+                                     previous_stock=10 ** 6, new_stock=10 ** 6 - item.quantity)
+                    for item in items
+                ], batch_size=500)
+                # bulk_create stamps auto_now_add fields with the current time
+                Sale.objects.filter(pk__in=[sale.pk for sale in sales]).update(date=moment)
+                StockTransaction.objects.filter(pk__in=[entry.pk for entry in ledger]).update(created_at=moment)
+                sale_count += len(sales)
+                item_count += len(items)
+        rollups.rebuild()
+
+        return {
+            'products': len(products),
+            'customers': len(customer_ids),
+            'days': days + 1,
+            'sales': sale_count,
+            'sale_items': item_count,
+            'stock_transactions': item_count,
+        }
+
+    def _bench_create_sale(self, rng, options):
+        from inventory import services
+        from inventory.models import Product
+
+        product_ids = list(Product.objects.values_list('pk', flat=True))
+        results = {}
+        for size in BASKET_SIZES:
+            def sale():
+                services.create_sale([{'product_id': pk, 'quantity': 1} for pk in rng.sample(product_ids, size)])
+            started = time.perf_counter()
+            durations, queries = _measure(sale, options['iterations'])
+            results[f'create_sale[basket={size}]'] = _summary(durations, queries, time.perf_counter() - started)
+        return results
+
+    def _bench_update_stock(self, options):
+        from inventory.models import Product
+
+        name = f'update_stock[workers={options["workers"]}]'
+        if 'fork' not in multiprocessing.get_all_start_methods():
+            return {name: {'skipped': 'needs the fork start method'}}
+
+        product_ids = list(Product.objects.order_by('pk').values_list('pk', flat=True)[:HOT_PRODUCTS])
+        context = multiprocessing.get_context('fork')
+        results = context.Queue()
+        # Children open their own connections; never share the parent's
+        connections.close_all()
+        processes = [
+            context.Process(target=_stock_worker, args=(product_ids, options['iterations'], seed, results))
+            for seed in range(options['workers'])
+        ]
+        started = time.perf_counter()
+        for process in processes:
+            process.start()
+        collected = [results.get() for _ in processes]
+        for process in processes:
+            process.join()
+        elapsed = time.perf_counter() - started
+
+        durations = [value for stats in collected for value in stats['durations']]
+        queries = [value for stats in collected for value in stats['queries']]
+        if not durations:
+            return {name: {'skipped': 'every update failed', 'locked': sum(s['locked'] for s in collected)}}
+        result = _summary(durations, queries, elapsed)
+        result['locked'] = sum(stats['locked'] for stats in collected)
+        result['errors'] = sum(stats['errors'] for stats in collected)
+        return {name: result}
+
+    def _client(self):
+        from django.contrib.auth import get_user_model
+        from django.test import Client
+
+        User = get_user_model()
+        user = User.objects.filter(username='bench').first() or User.objects.create_superuser(
+            'bench', 'bench@example.com', None)
+        client = Client()
+        client.force_login(user)
+        return client
+
+    def _get(self, client, url, iterations, before=None):
+        def request():
+            if before is not None:
+                before()
+            response = client.get(url)
+            if response.status_code != 200:
+                raise CommandError(f'GET {url} returned {response.status_code}')
+        return _summary(*_measure(request, iterations))
+
+    def _bench_charts(self, options):
+        from inventory import caching
+
+        client = self._client()
+        cache = caching.chart_cache()
+        results = {}
+        for name, takes_days in CHARTS.items():
+            url = reverse(f'inventory:{name}')
+            # Cold runs: the chart cache is cleared before every request
+            if takes_days:
+                for days in DAY_WINDOWS:
+                    results[f'{name}[days={days}]'] = self._get(
+                        client, f'{url}?days={days}', options['iterations'], before=cache.clear)
+            else:
+                results[name] = self._get(client, url, options['iterations'], before=cache.clear)
+        return results
+
+    def _bench_barcode(self, rng, options):
+        from inventory.models import Product
+
+        client = self._client()
+        barcodes = list(Product.objects.values_list('barcode', flat=True))
+
+        def lookup():
+            response = client.get(reverse('inventory:get_product_by_barcode', args=[rng.choice(barcodes)]))
+            if response.status_code != 200:
+                raise CommandError(f'Barcode lookup returned {response.status_code}')
+        return {'barcode_lookup': _summary(*_measure(lookup, options['iterations']))}
+
+    def _bench_changelists(self, options):
+        client = self._client()
+        return {
+            f'admin_{model}_changelist': self._get(
+                client, reverse(f'admin:inventory_{model}_changelist'), options['iterations'])
+            for model in CHANGELISTS
+        }
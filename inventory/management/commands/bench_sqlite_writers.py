@@ -0,0 +1,146 @@
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.core.exceptions import ValidationError
+from django.conf import settings
+from django.db import OperationalError, connections
+from django.http import QueryDict
+import multiprocessing
+import os
+import random
+import tempfile
+import time
+
+def _use_database(path, pragmas, transaction_mode):
+    """Point this process's default connection at ``path`` with the given profile."""
+    settings.SQLITE_PRAGMAS = pragmas
+    settings.SQLITE_TRANSACTION_MODE = transaction_mode
+    connections.close_all()
+    connections['default'].settings_dict['NAME'] = path
+
+def _percentile(values, fraction):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+def _writer(path, pragmas, transaction_mode, product_ids, lines, deadline, results):
+    from inventory import services
+
+    _use_database(path, pragmas, transaction_mode)
+    rng = random.Random(os.getpid())
+    stats = {'sales': 0, 'locked': 0, 'errors': 0, 'latencies': []}
+    while time.monotonic() < deadline:
+        items = [{'product_id': pk, 'quantity': 1} for pk in rng.sample(product_ids, lines)]
+        started = time.perf_counter()
+        try:
+            services.create_sale(items)
+        except OperationalError as e:
+            stats['locked' if 'locked' in str(e) else 'errors'] += 1
+            continue
+        except ValidationError:
+            stats['errors'] += 1
+            continue
+        stats['sales'] += 1
+        stats['latencies'].append(time.perf_counter() - started)
+    connections.close_all()
+    results.put(('writer', stats))
+
+def _reader(path, pragmas, transaction_mode, deadline, results):
+    from inventory import charts
+
+    _use_database(path, pragmas, transaction_mode)
+    stats = {'reads': 0, 'locked': 0}
+    while time.monotonic() < deadline:
+        try:
+            charts.dashboard_data(QueryDict(), charts.CHARTS)
+        except OperationalError:
+            stats['locked'] += 1
+            continue
+        stats['reads'] += 1
+    connections.close_all()
+    results.put(('reader', stats))
+
+class Command(BaseCommand):
+    help = ('Compare parallel create_sale writers (plus dashboard readers) on a scratch SQLite '
+            'database with the default settings and with the production profile')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--writers', type=int, default=4, help='Concurrent writer processes (default: 4)')
+        parser.add_argument('--readers', type=int, default=1, help='Concurrent dashboard readers (default: 1)')
+        parser.add_argument('--duration', type=float, default=10, help='Seconds per run (default: 10)')
+        parser.add_argument('--products', type=int, default=50, help='Products in the scratch catalog (default: 50)')
+        parser.add_argument('--lines', type=int, default=3, help='Lines per sale (default: 3)')
+
+    def handle(self, *args, **options):
+        if connections['default'].vendor != 'sqlite':
+            raise CommandError('bench_sqlite_writers only runs against SQLite')
+        if options['lines'] > options['products']:
+            raise CommandError('--lines cannot exceed --products')
+
+        profiles = [
+            ('default', {}, ''),
+            ('production', settings.SQLITE_PRODUCTION_PRAGMAS, settings.SQLITE_PRODUCTION_TRANSACTION_MODE),
+        ]
+        rows = []
+        for label, pragmas, transaction_mode in profiles:
+            with tempfile.TemporaryDirectory() as directory:
+                path = os.path.join(directory, 'bench.sqlite3')
+                self.stdout.write(f'Running {label} profile ({options["writers"]} writers, '
+                                  f'{options["readers"]} readers, {options["duration"]:g}s)...')
+                product_ids = self._prepare(path, pragmas, transaction_mode, options['products'])
+                rows.append((label, self._run(path, pragmas, transaction_mode, product_ids, options)))
+
+        self.stdout.write('')
+        self.stdout.write(f'{"profile":<12}{"sales/s":>10}{"locked":>9}{"errors":>9}'
+                          f'{"p50 ms":>9}{"p95 ms":>9}{"reads/s":>10}')
+        for label, result in rows:
+            self.stdout.write(
+                f'{label:<12}{result["sales_per_second"]:>10.1f}{result["locked"]:>9}{result["errors"]:>9}'
+                f'{result["p50"] * 1000:>9.1f}{result["p95"] * 1000:>9.1f}{result["reads_per_second"]:>10.1f}'
+            )
+
+    def _prepare(self, path, pragmas, transaction_mode, product_count):
+        from inventory.models import Category, Product
+
+        _use_database(path, pragmas, transaction_mode)
+        call_command('migrate', verbosity=0, interactive=False)
+        category = Category.objects.create(name='Benchmark')
+        Product.objects.bulk_create([
+            Product(name=f'Benchmark product {i}', category=category, purchase_price=1, selling_price=2,
+                    stock_quantity=10 ** 9, max_stock_level=10 ** 9, low_stock_alert=False)
+            for i in range(product_count)
+        ])
+        product_ids = list(Product.objects.values_list('pk', flat=True))
+        # Children open their own connections; never share the parent's
+        connections.close_all()
+        return product_ids
+
+    def _run(self, path, pragmas, transaction_mode, product_ids, options):
+        context = multiprocessing.get_context('fork')
+        results = context.Queue()
+        deadline = time.monotonic() + options['duration']
+        processes = [
+            context.Process(target=_writer, args=(path, pragmas, transaction_mode, product_ids,
+                                                  options['lines'], deadline, results))
+            for _ in range(options['writers'])
+        ] + [
+            context.Process(target=_reader, args=(path, pragmas, transaction_mode, deadline, results))
+            for _ in range(options['readers'])
+        ]
+        for process in processes:
+            process.start()
+        collected = [results.get() for _ in processes]
+        for process in processes:
+            process.join()
+
+        writers = [stats for kind, stats in collected if kind == 'writer']
+        readers = [stats for kind, stats in collected if kind == 'reader']
+        latencies = [latency for stats in writers for latency in stats['latencies']]
+        return {
+            'sales_per_second': sum(stats['sales'] for stats in writers) / options['duration'],
+            'locked': sum(stats['locked'] for stats in writers + readers),
+            'errors': sum(stats['errors'] for stats in writers),
+            'p50': _percentile(latencies, 0.50),
+            'p95': _percentile(latencies, 0.95),
+            'reads_per_second': sum(stats['reads'] for stats in readers) / options['duration'],
+        }
@@ -0,0 +1,54 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+import json
+
+from inventory import querystats
+
+SORT_KEYS = ('requests', 'queries', 'db_ms', 'total_ms', 'bytes')
+
+class Command(BaseCommand):
+    help = 'Show per-endpoint query count, DB time, total time and response size recorded by the web workers'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sort', choices=SORT_KEYS, default='total_ms',
+                            help='Order endpoints by this column, largest p95 first (default: total_ms)')
+        parser.add_argument('--max-age', type=int, default=None,
+                            help='Ignore worker dumps older than this many seconds (default: ENDPOINT_STATS_MAX_AGE)')
+        parser.add_argument('--json', action='store_true',
+                            help='Print the statistics as JSON')
+        parser.add_argument('--reset', action='store_true',
+                            help='Delete the recorded statistics instead of showing them')
+
+    def handle(self, *args, **options):
+        if options['reset']:
+            querystats.reset()
+            self.stdout.write(self.style.SUCCESS('Endpoint statistics deleted'))
+            return
+
+        max_age = options['max_age'] if options['max_age'] is not None else settings.ENDPOINT_STATS_MAX_AGE
+        dumps = querystats.load_dumps(max_age=max_age)
+        summary = querystats.summarize(dumps)
+        if options['json']:
+            self.stdout.write(json.dumps(summary, indent=2))
+            return
+
+        sort = options['sort']
+        rows = sorted(
+            summary.items(),
+            key=lambda item: item[1][sort] if sort == 'requests' else item[1][sort]['p95'],
+            reverse=True,
+        )
+        self.stdout.write(
+            f'{"endpoint":<48} {"reqs":>7} {"queries p50/p95/max":>20} {"db ms p50/p95":>16} '
+            f'{"total ms p50/p95/p99":>24} {"bytes p95":>10}'
+        )
+        for endpoint, row in rows:
+            queries, db_ms, total_ms = row['queries'], row['db_ms'], row['total_ms']
+            self.stdout.write(
+                f'{endpoint:<48} {row["requests"]:>7} '
+                f'{queries["p50"]:>6}/{queries["p95"]:>6}/{queries["max"]:>6} '
+                f'{db_ms["p50"]:>7.1f}/{db_ms["p95"]:>8.1f} '
+                f'{total_ms["p50"]:>7.1f}/{total_ms["p95"]:>7.1f}/{total_ms["p99"]:>8.1f} '
+                f'{row["bytes"]["p95"]:>10}'
+            )
+        self.stdout.write(self.style.SUCCESS(f'{len(rows)} endpoints from {len(dumps)} worker dumps'))
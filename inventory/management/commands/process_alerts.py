@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+from datetime import timedelta
+import time
+
+from inventory.alerts import process_pending_alerts
+
+class Command(BaseCommand):
+    help = 'Send queued low stock alerts as coalesced digest emails'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--window', type=int, default=None,
+                            help='Minutes within which repeated alerts for a product are coalesced')
+        parser.add_argument('--batch-size', type=int, default=None,
+                            help='Maximum number of products per digest email')
+        parser.add_argument('--loop', action='store_true',
+                            help='Keep running as a worker instead of exiting after one pass')
+        parser.add_argument('--interval', type=int, default=60,
+                            help='Seconds to sleep between passes when running with --loop')
+
+    def handle(self, *args, **options):
+        window = timedelta(minutes=options['window']) if options['window'] is not None else None
+
+        while True:
+            sent, failed = process_pending_alerts(window=window, batch_size=options['batch_size'])
+            if sent or failed:
+                self.stdout.write(f'Alerted {sent} products, {failed} failed')
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+
+        self.stdout.write(self.style.SUCCESS('Done processing alerts'))
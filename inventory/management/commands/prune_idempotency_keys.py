@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from datetime import timedelta
+
+from inventory.models import IdempotencyKey
+
+class Command(BaseCommand):
+    help = 'Delete stored POS idempotency keys older than the retry window'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=7,
+                            help='Keep keys created within this many days (default: 7)')
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options['days'])
+        deleted, _ = IdempotencyKey.objects.filter(created_at__lt=cutoff).delete()
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} idempotency keys older than {options["days"]} days'))
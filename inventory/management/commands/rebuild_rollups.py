@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand, CommandError
+from datetime import date
+
+from inventory import rollups
+
+class Command(BaseCommand):
+    help = 'Rebuild the daily sales rollup tables from raw sales'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', type=str, default=None,
+                            help='Only rebuild days on or after this date (YYYY-MM-DD)')
+
+    def handle(self, *args, **options):
+        since = None
+        if options['since']:
+            try:
+                since = date.fromisoformat(options['since'])
+            except ValueError:
+                raise CommandError('--since must be a date in YYYY-MM-DD format')
+
+        self.stdout.write(f'Rebuilding rollups{" since " + str(since) if since else ""}...')
+        rows = rollups.rebuild(since=since)
+        self.stdout.write(self.style.SUCCESS(f'Successfully rebuilt {rows} daily product rows'))
@@ -0,0 +1,69 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from datetime import datetime, timedelta
+
+from inventory.slowqueries import normalize, read_log
+
+class Command(BaseCommand):
+    help = 'Summarize the slow query log by normalized SQL, worst offenders first'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--file', default=None,
+                            help='Slow query log to read (default: SLOW_QUERY_LOG_FILE)')
+        parser.add_argument('--hours', type=int, default=None,
+                            help='Only include queries logged within this many hours')
+        parser.add_argument('--sort', choices=('total', 'max', 'count'), default='total',
+                            help='Rank by total time, slowest single run or number of runs (default: total)')
+        parser.add_argument('--limit', type=int, default=10,
+                            help='Number of statements to show (default: 10)')
+        parser.add_argument('--plans', action='store_true',
+                            help='Show the EXPLAIN plan of the slowest run of each statement')
+
+    def handle(self, *args, **options):
+        path = options['file'] or settings.SLOW_QUERY_LOG_FILE
+        entries = read_log(path)
+        if options['hours'] is not None:
+            cutoff = timezone.now() - timedelta(hours=options['hours'])
+            entries = [entry for entry in entries if datetime.fromisoformat(entry['time']) >= cutoff]
+        if not entries:
+            if not settings.SLOW_QUERY_LOG_ENABLED:
+                raise CommandError(f'No slow queries in {path}; set SLOW_QUERY_LOG_ENABLED=True to record them')
+            self.stdout.write(self.style.SUCCESS(f'No slow queries in {path}'))
+            return
+
+        groups = {}
+        for entry in entries:
+            group = groups.setdefault(entry['fingerprint'], {'count': 0, 'total': 0.0, 'slowest': entry, 'views': {}})
+            group['count'] += 1
+            group['total'] += entry['ms']
+            if entry['ms'] > group['slowest']['ms']:
+                group['slowest'] = entry
+            view = entry['view'] or entry['caller'] or '-'
+            group['views'][view] = group['views'].get(view, 0) + 1
+
+        rank = {
+            'total': lambda group: group['total'],
+            'max': lambda group: group['slowest']['ms'],
+            'count': lambda group: group['count'],
+        }[options['sort']]
+        ranked = sorted(groups.items(), key=lambda item: rank(item[1]), reverse=True)
+
+        for fingerprint, group in ranked[:options['limit']]:
+            slowest = group['slowest']
+            self.stdout.write(self.style.WARNING(
+                f'{fingerprint}  runs {group["count"]}  total {group["total"]:.0f} ms  '
+                f'avg {group["total"] / group["count"]:.0f} ms  max {slowest["ms"]:.0f} ms'
+            ))
+            self.stdout.write(f'    {normalize(slowest["sql"])}')
+            views = sorted(group['views'].items(), key=lambda item: item[1], reverse=True)
+            self.stdout.write('    from: ' + ', '.join(f'{view} ({count})' for view, count in views[:3]))
+            self.stdout.write(f'    slowest: {slowest["time"]} params {slowest["params"]}')
+            if options['plans'] and slowest.get('plan'):
+                for line in slowest['plan'].splitlines():
+                    self.stdout.write(f'      {line}')
+            self.stdout.write('')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'{len(entries)} slow queries, {len(groups)} distinct statements in {path}'
+        ))
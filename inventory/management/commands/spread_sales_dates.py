@@ -3,6 +3,7 @@ from django.utils import timezone
 from datetime import timedelta
 import random
 from inventory.models import Sale
+from inventory import rollups
 
 class Command(BaseCommand):
     help = 'Spread existing sales across the last 90 days'
@@ -34,4 +35,7 @@ class Command(BaseCommand):
             
             self.stdout.write(f'Updated sale #{sale.id} to date: {new_date.strftime("%Y-%m-%d")}')
         
+        # Sales moved to other days, so the daily rollups have to follow
+        rollups.rebuild()
+
         self.stdout.write(self.style.SUCCESS(f'Successfully spread {total_sales} sales across 90 days')) 
\ No newline at end of file
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from inventory.routers import REPLICA_DB_ALIAS, replica_configured
+import sqlite3
+
+class Command(BaseCommand):
+    help = 'Copy the primary SQLite database into the replica file (local replica testing)'
+
+    def handle(self, *args, **options):
+        if not replica_configured():
+            raise CommandError('No replica database is configured (set REPLICA_DB_NAME)')
+        primary = connections['default']
+        replica = connections[REPLICA_DB_ALIAS]
+        if primary.vendor != 'sqlite' or replica.vendor != 'sqlite':
+            raise CommandError('sync_replica only copies SQLite files; use your database replication otherwise')
+
+        replica.close()
+        primary.ensure_connection()
+        target = sqlite3.connect(str(replica.settings_dict['NAME']))
+        try:
+            primary.connection.backup(target)
+        finally:
+            target.close()
+        self.stdout.write(self.style.SUCCESS(f'Copied {primary.settings_dict["NAME"]} to {replica.settings_dict["NAME"]}'))
@@ -0,0 +1,339 @@
+"""
+Prometheus metrics in the text exposition format.
+
+Each process keeps its counters and histograms in a memory-mapped file,
+``METRICS_DIR/<pid>-<token>.db``, so every increment is in the file at once
+and survives the process being killed. The random token gives a forked child
+or a new process that reuses a pid a file of its own. The
+``/inventory/metrics`` view adds up the files of every process, so the numbers
+cover all the workers of a pre-fork server as well as the management
+commands, without a database query.
+
+Files of processes that have exited are folded into ``METRICS_DIR/base.json``
+and deleted, so the totals do not go backwards when a worker is recycled and
+the directory does not grow. Empty ``METRICS_DIR`` when deploying to start
+from zero.
+
+Counters for database writes are incremented once the transaction commits, so
+rolled back sales are not counted.
+"""
+
+import json
+import mmap
+import os
+import secrets
+import struct
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+from django.conf import settings
+from django.db import transaction
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+BASE_FILE = 'base.json'
+LOCK_DIR = 'merge.lock'
+# A merge lock older than this was left by a killed process
+STALE_LOCK_SECONDS = 30
+INITIAL_FILE_SIZE = 64 * 1024
+
+_lock = threading.Lock()
+_file = None
+
+METRICS = {}
+
+
+class _ValueFile:
+    """
+    Float values by key in a memory-mapped file written by one process.
+
+    Layout: the number of bytes in use (a 4-byte int, padded to 8), then one
+    entry per key: the key's length, the key, padding to 8 bytes and the value
+    as a double, so values are updated in place with aligned writes.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'w+b')
+        self._file.truncate(INITIAL_FILE_SIZE)
+        self._capacity = INITIAL_FILE_SIZE
+        self._map = mmap.mmap(self._file.fileno(), self._capacity)
+        self._used = 8
+        struct.pack_into('i', self._map, 0, self._used)
+        self._positions = {}
+
+    def add(self, key, amount):
+        position = self._positions.get(key)
+        if position is None:
+            position = self._append(key)
+        value, = struct.unpack_from('d', self._map, position)
+        struct.pack_into('d', self._map, position, value + amount)
+
+    def _append(self, key):
+        encoded = key.encode()
+        padding = -(4 + len(encoded)) % 8
+        size = 4 + len(encoded) + padding + 8
+        while self._used + size > self._capacity:
+            self._capacity *= 2
+            self._map.close()
+            self._file.truncate(self._capacity)
+            self._map = mmap.mmap(self._file.fileno(), self._capacity)
+        struct.pack_into(f'i{len(encoded)}s{padding}xd', self._map, self._used, len(encoded), encoded, 0.0)
+        self._used += size
+        # Readers only see the entry once it is complete
+        struct.pack_into('i', self._map, 0, self._used)
+        self._positions[key] = self._used - 8
+        return self._used - 8
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+
+
+def _read_values(path):
+    """``{key: value}`` of a ``_ValueFile`` written by any process."""
+    data = path.read_bytes()
+    if len(data) < 8:
+        return {}
+    used, = struct.unpack_from('i', data, 0)
+    values = {}
+    position = 8
+    while position < used:
+        length, = struct.unpack_from('i', data, position)
+        key = data[position + 4:position + 4 + length].decode()
+        position += 4 + length + (-(4 + length) % 8)
+        values[key], = struct.unpack_from('d', data, position)
+        position += 8
+    return values
+
+
+def _values():
+    """This process's value file, created on first use."""
+    global _file
+    if _file is None:
+        directory = _metrics_dir()
+        directory.mkdir(parents=True, exist_ok=True)
+        _file = _ValueFile(directory / f'{os.getpid()}-{secrets.token_hex(8)}.db')
+    return _file
+
+
+def _after_fork():
+    # The child writes a file of its own; the parent's stays the parent's
+    global _file, _lock
+    _file = None
+    _lock = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork)
+
+
+def _key(name, labels, field=None):
+    """``field`` is None for a counter, a bucket index, 'sum' or 'count' for a histogram."""
+    return json.dumps([name, list(labels), field])
+
+
+class Counter:
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        METRICS[name] = self
+
+    def inc(self, amount=1, **labels):
+        key = _key(self.name, (str(labels[label]) for label in self.labelnames))
+        with _lock:
+            _values().add(key, amount)
+
+    def inc_on_commit(self, amount=1, **labels):
+        """Increment once the current transaction commits (at once outside one)."""
+        transaction.on_commit(lambda: self.inc(amount, **labels))
+
+
+class Histogram:
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        METRICS[name] = self
+
+    def observe(self, value, **labels):
+        labels = [str(labels[label]) for label in self.labelnames]
+        with _lock:
+            values = _values()
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    values.add(_key(self.name, labels, i), 1)
+            values.add(_key(self.name, labels, 'sum'), value)
+            values.add(_key(self.name, labels, 'count'), 1)
+
+
+sales_created = Counter(
+    'inventory_sales_created_total', 'Sales created through the POS sale service.')
+items_sold = Counter(
+    'inventory_items_sold_total', 'Units sold through the POS sale service.')
+stock_transactions = Counter(
+    'inventory_stock_transactions_total', 'Stock ledger entries written.', ['transaction_type'])
+alerts_queued = Counter(
+    'inventory_low_stock_alerts_queued_total', 'Low stock alerts queued in the outbox.')
+alerts_delivered = Counter(
+    'inventory_low_stock_alerts_total', 'Products included in low stock alert emails, by outcome.', ['result'])
+request_duration = Histogram(
+    'inventory_request_duration_seconds', 'Request latency by view.', ['view'])
+
+
+def _metrics_dir():
+    return Path(settings.METRICS_DIR)
+
+
+def reset():
+    """Discard this process's metrics and its file, e.g. after a benchmark."""
+    global _file
+    with _lock:
+        if _file is not None:
+            _file.close()
+            _file.path.unlink(missing_ok=True)
+            _file = None
+
+
+def _alive(pid):
+    if os.name == 'nt':
+        # os.kill would terminate the process; keep every file instead
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+@contextmanager
+def _merge_lock(directory):
+    """Hold ``directory``'s merge lock; a directory, as mkdir is atomic everywhere."""
+    lock = directory / LOCK_DIR
+    while True:
+        try:
+            lock.mkdir()
+            break
+        except FileExistsError:
+            try:
+                stale = time.time() - lock.stat().st_mtime > STALE_LOCK_SECONDS
+            except FileNotFoundError:
+                continue
+            if stale:
+                try:
+                    lock.rmdir()
+                except OSError:
+                    pass
+            else:
+                time.sleep(0.01)
+    try:
+        yield
+    finally:
+        try:
+            lock.rmdir()
+        except OSError:
+            pass
+
+
+def _collect():
+    """
+    ``{key: value}`` summed over every process, folding the files of exited
+    processes into the base file first.
+    """
+    directory = _metrics_dir()
+    if not directory.exists():
+        return {}
+    with _merge_lock(directory):
+        base_path = directory / BASE_FILE
+        base = json.loads(base_path.read_text()) if base_path.exists() else {'values': {}, 'merged': []}
+        # Files of the last merge that were not deleted are already in the base
+        merged = set(base['merged'])
+        folded = dict(base['values'])
+        totals = dict(folded)
+        exited = []
+        for path in sorted(directory.glob('*.db')):
+            if path.name in merged:
+                path.unlink(missing_ok=True)
+                continue
+            try:
+                values = _read_values(path)
+            except (OSError, struct.error, UnicodeDecodeError):
+                continue
+            pid = int(path.name.split('-')[0])
+            if pid != os.getpid() and not _alive(pid):
+                exited.append(path)
+                for key, value in values.items():
+                    folded[key] = folded.get(key, 0) + value
+            for key, value in values.items():
+                totals[key] = totals.get(key, 0) + value
+        if exited:
+            tmp = base_path.with_suffix('.tmp')
+            tmp.write_text(json.dumps({'values': folded, 'merged': [path.name for path in exited]}))
+            os.replace(tmp, base_path)
+            for path in exited:
+                path.unlink(missing_ok=True)
+    return totals
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _count(value):
+    # Values are stored as doubles; whole counts are shown as integers
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def render():
+    """Every process's metrics in the Prometheus text exposition format."""
+    counters = {}
+    histograms = {}
+    for key, value in _collect().items():
+        name, labels, field = json.loads(key)
+        if field is None:
+            counters[(name, tuple(labels))] = value
+        else:
+            histograms.setdefault((name, tuple(labels)), {})[field] = value
+
+    lines = []
+    for metric in METRICS.values():
+        lines.append(f'# HELP {metric.name} {metric.documentation}')
+        if isinstance(metric, Counter):
+            lines.append(f'# TYPE {metric.name} counter')
+            for (name, labels), value in sorted(counters.items()):
+                if name == metric.name:
+                    lines.append(f'{name}{_labels(metric.labelnames, labels)} {_count(value)}')
+            if not metric.labelnames and (metric.name, ()) not in counters:
+                lines.append(f'{metric.name} 0')
+        else:
+            lines.append(f'# TYPE {metric.name} histogram')
+            for (name, labels), fields in sorted(histograms.items()):
+                if name != metric.name:
+                    continue
+                count = fields.get('count', 0)
+                buckets = [fields.get(i, 0) for i in range(len(metric.buckets))] + [count]
+                for bound, bucket_count in zip(metric.buckets + (float('inf'),), buckets):
+                    bucket_labels = _labels(metric.labelnames, labels, [('le', _number(bound))])
+                    lines.append(f'{name}_bucket{bucket_labels} {_count(bucket_count)}')
+                lines.append(f'{name}_sum{_labels(metric.labelnames, labels)} {_number(fields.get("sum", 0.0))}')
+                lines.append(f'{name}_count{_labels(metric.labelnames, labels)} {_count(count)}')
+    return '\n'.join(lines) + '\n'
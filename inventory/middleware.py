@@ -0,0 +1,141 @@
+import time
+
+from django.conf import settings
+
+from . import metrics, querystats, slowqueries
+from .instrumentation import collect_spans, summarize, timing_enabled, timing_logger
+from .routers import activate_replica_reads, deactivate_replica_reads, replica_configured
+
+# Set after a write so the same browser reads its own writes from ``default``
+REPLICA_PIN_COOKIE = 'db_pinned'
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Serve safe requests to ``@replica_view`` views and admin changelists from
+    the read replica. A request that changes data pins its browser to the
+    primary for ``REPLICA_STICKY_SECONDS`` so people see their own writes.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.replica_token = None
+        try:
+            response = self.get_response(request)
+        finally:
+            if request.replica_token is not None:
+                deactivate_replica_reads(request.replica_token)
+        if request.method not in SAFE_METHODS and response.status_code < 400 and replica_configured():
+            response.set_cookie(REPLICA_PIN_COOKIE, '1', max_age=settings.REPLICA_STICKY_SECONDS,
+                                httponly=True, samesite='Lax')
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if self._wants_replica(request, view_func):
+            request.replica_token = activate_replica_reads()
+
+    def _wants_replica(self, request, view_func):
+        if request.method not in SAFE_METHODS or not replica_configured():
+            return False
+        if request.COOKIES.get(REPLICA_PIN_COOKIE):
+            return False
+        if getattr(view_func, 'use_replica', False):
+            return True
+        match = request.resolver_match
+        return bool(match and match.namespace == 'admin' and (match.url_name or '').endswith('_changelist'))
+
+
+class TimingMiddleware:
+    """
+    Log the duration of each request with the timing spans it ran, while the
+    ``inventory.timing`` logger is enabled. With ``DEBUG`` on the spans are
+    also sent in a ``Server-Timing`` header for the browser's developer tools.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not timing_enabled():
+            return self.get_response(request)
+
+        start = time.perf_counter()
+        with collect_spans() as spans:
+            response = self.get_response(request)
+        elapsed = (time.perf_counter() - start) * 1000
+
+        totals = summarize(spans)
+        timing_logger.info(
+            'request %s %s %s %.2fms%s', request.method, request.path, response.status_code, elapsed,
+            ''.join(f' {name}={total:.2f}ms/{count}' for name, (count, total) in totals.items()),
+        )
+        if settings.DEBUG:
+            response['Server-Timing'] = ', '.join(
+                [f'total;dur={elapsed:.2f}']
+                + [f'{name.replace(".", "-")};dur={total:.2f}' for name, (count, total) in totals.items()]
+            )
+        return response
+
+
+class QueryStatsMiddleware:
+    """
+    Record the query count, database time, total time and response size of
+    every request to a resolved URL, see ``inventory.querystats``.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.ENDPOINT_STATS_ENABLED:
+            return self.get_response(request)
+
+        counter = querystats.QueryCounter()
+        start = time.perf_counter()
+        with querystats.count_queries(counter):
+            response = self.get_response(request)
+        elapsed = (time.perf_counter() - start) * 1000
+
+        match = request.resolver_match
+        if match is not None:
+            size = len(response.content) if not response.streaming else int(response.get('Content-Length') or 0)
+            querystats.record(match.view_name, counter.queries, counter.db_ms, elapsed, size)
+            querystats.maybe_dump()
+        return response
+
+
+class MetricsMiddleware:
+    """Observe the latency of every request to a resolved URL in ``inventory_request_duration_seconds``."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        start = time.perf_counter()
+        response = self.get_response(request)
+        match = request.resolver_match
+        if match is not None:
+            metrics.request_duration.observe(time.perf_counter() - start, view=match.view_name)
+        return response
+
+
+class SlowQueryMiddleware:
+    """Tell the slow query log which view (or admin page) issued its queries."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = slowqueries.current_view.set('')
+        try:
+            return self.get_response(request)
+        finally:
+            slowqueries.current_view.reset(token)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        match = request.resolver_match
+        slowqueries.current_view.set(match.view_name if match else request.path)
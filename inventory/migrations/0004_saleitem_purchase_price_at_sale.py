@@ -0,0 +1,30 @@
+# Generated by Django 4.2.30 on 2026-10-17 01:23
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def backfill_purchase_price(apps, schema_editor):
+    SaleItem = apps.get_model('inventory', 'SaleItem')
+    Product = apps.get_model('inventory', 'Product')
+    SaleItem.objects.filter(purchase_price_at_sale__isnull=True).update(
+        purchase_price_at_sale=Subquery(
+            Product.objects.filter(pk=OuterRef('product_id')).values('purchase_price')[:1]
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0003_stockalert'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='saleitem',
+            name='purchase_price_at_sale',
+            field=models.DecimalField(blank=True, decimal_places=2, editable=False, max_digits=10, null=True),
+        ),
+        migrations.RunPython(backfill_purchase_price, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 4.2.30 on 2026-10-17 01:25
+
+from decimal import Decimal
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0004_saleitem_purchase_price_at_sale'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyProductSales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('units', models.IntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=12)),
+                ('cost', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=12)),
+                ('profit', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=12)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_sales', to='inventory.product')),
+            ],
+            options={
+                'verbose_name_plural': 'Daily product sales',
+                'ordering': ['-date'],
+            },
+        ),
+        migrations.CreateModel(
+            name='DailyCategorySales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('units', models.IntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=12)),
+                ('cost', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=12)),
+                ('profit', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=12)),
+                ('category', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='daily_sales', to='inventory.category')),
+            ],
+            options={
+                'verbose_name_plural': 'Daily category sales',
+                'ordering': ['-date'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='dailyproductsales',
+            constraint=models.UniqueConstraint(fields=('date', 'product'), name='unique_daily_product_sales'),
+        ),
+        migrations.AddConstraint(
+            model_name='dailycategorysales',
+            constraint=models.UniqueConstraint(fields=('date', 'category'), name='unique_daily_category_sales'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.30 on 2026-10-17 01:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0006_idempotencykey'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='stocktransaction',
+            index=models.Index(fields=['product', '-created_at', '-id'], name='stocktx_product_created_idx'),
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 4.2.30 on 2026-10-17 01:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0007_stocktransaction_product_created_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='customer',
+            index=models.Index(fields=['created_at'], name='customer_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['is_active', 'name', 'stock_quantity', 'min_stock_level'], name='product_active_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['updated_at'], name='product_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='productpricehistory',
+            index=models.Index(fields=['product', '-changed_at'], name='pricehistory_product_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='sale',
+            index=models.Index(fields=['-date'], name='sale_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='saleitem',
+            index=models.Index(fields=['sale', 'product'], name='saleitem_sale_product_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='stockalert',
+            index=models.Index(condition=models.Q(('status', 'PENDING')), fields=['product', '-created_at'], name='stockalert_pending_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='stockalert',
+            index=models.Index(fields=['status', 'sent_at'], name='stockalert_status_sent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='stocktransaction',
+            index=models.Index(fields=['-created_at'], name='stocktx_created_idx'),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 4.2.30 on 2026-10-17 02:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0010_category_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='productpricehistory',
+            index=models.Index(fields=['-changed_at'], name='pricehistory_changed_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='salereturn',
+            index=models.Index(fields=['-processed_at'], name='salereturn_processed_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='stockalert',
+            index=models.Index(fields=['-created_at'], name='stockalert_created_idx'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 4.2.30 on 2026-10-17 02:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0011_changelist_ordering_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DeletedProduct',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('product_id', models.BigIntegerField()),
+                ('deleted_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+            options={
+                'ordering': ['-deleted_at'],
+            },
+        ),
+    ]
@@ -2,18 +2,38 @@ from django.db import models
 from django.core.validators import MinValueValidator
 from decimal import Decimal
 from django.db.models import F, Sum
-from django.db.models.signals import post_delete, post_save
+from django.db.models.functions import Coalesce
+from django.db.models.signals import post_delete, post_save, pre_delete
 from django.dispatch import receiver
 from django.core.exceptions import ValidationError
 from django.db import transaction
 from django.utils import timezone
-from django.core.mail import send_mail
 from django.conf import settings
+from contextlib import contextmanager
+from contextvars import ContextVar
+import logging
+
+from . import caching, metrics, rollups, stock
+
+logger = logging.getLogger(__name__)
+
+# Set while a bulk delete removes empty sales itself (see services.delete_sale_items)
+_empty_sale_cleanup_deferred = ContextVar('empty_sale_cleanup_deferred', default=False)
+
+@contextmanager
+def deferred_empty_sale_cleanup():
+    """Skip the per-item empty sale check of ``check_and_delete_empty_sale``."""
+    token = _empty_sale_cleanup_deferred.set(True)
+    try:
+        yield
+    finally:
+        _empty_sale_cleanup_deferred.reset(token)
 
 class Category(models.Model):
     name = models.CharField(max_length=100, unique=True)
     description = models.TextField(blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return self.name
@@ -43,7 +63,7 @@ class Product(models.Model):
     def get_available_stock(self):
         """Get the current available stock, considering any pending sales."""
         self.refresh_from_db()  # Ensure we have the latest data
-        print(f"DEBUG: Product {self.name} current stock: {self.stock_quantity}")
+        logger.debug('Product %s current stock: %s', self.pk, self.stock_quantity)
         return self.stock_quantity
 
     def update_stock(self, quantity_change, transaction_type='ADJUSTMENT', notes=''):
@@ -51,60 +71,50 @@ class Product(models.Model):
         Update the stock quantity by the given amount.
         Positive values increase stock, negative values decrease stock.
         Returns the actual quantity change applied.
-        """
-        self.refresh_from_db()  # Ensure we have the latest data
-        current_stock = self.stock_quantity
-        new_stock = current_stock + quantity_change
 
-        # Validate against max_stock_level for increases
-        if quantity_change > 0 and new_stock > self.max_stock_level:
-            raise ValidationError(f'Cannot exceed maximum stock level of {self.max_stock_level}')
+        The change is applied with a single conditional UPDATE, so concurrent
+        callers cannot lose each other's updates. Increases beyond
+        max_stock_level raise ValidationError; decreases stop at zero.
+        """
+        if not quantity_change:
+            return 0
 
-        # Prevent negative stock
-        new_stock = max(0, new_stock)
-        
         with transaction.atomic():
-            self.stock_quantity = new_stock
-            self.save()
-            
-            # Create stock transaction record
-            StockTransaction.objects.create(
-                product=self,
-                quantity=abs(quantity_change),
-                is_increase=quantity_change > 0,
-                transaction_type=transaction_type,
-                notes=notes,
-                previous_stock=current_stock,
-                new_stock=new_stock
+            change = stock.apply_stock_change(self.pk, quantity_change, clamp=True)
+            stock.record_stock_transactions(
+                [change], transaction_type=transaction_type, notes=notes
             )
-            
+            self.stock_quantity = change.new_stock
+
             # Check for low stock alert
-            if self.low_stock_alert and self.stock_quantity <= self.min_stock_level:
+            if change.needs_low_stock_alert:
                 self.send_low_stock_alert()
-                
-        return new_stock - current_stock
+
+        return change.quantity_change
 
     def send_low_stock_alert(self):
-        subject = f'Low Stock Alert: {self.name}'
-        message = f'''
-        Low stock alert for {self.name}
-        Current stock: {self.stock_quantity}
-        Minimum stock level: {self.min_stock_level}
-        Please restock soon.
-        '''
-        try:
-            send_mail(
-                subject,
-                message,
-                settings.DEFAULT_FROM_EMAIL,
-                [settings.STOCK_ALERT_EMAIL],
-                fail_silently=False,
-            )
-        except Exception as e:
-            print(f"Failed to send low stock alert: {e}")
+        """
+        Queue a low stock alert in the outbox. The alert is written in the
+        caller's transaction and emailed later by the process_alerts command.
+        """
+        StockAlert.objects.create(
+            product=self,
+            stock_quantity=self.stock_quantity,
+            min_stock_level=self.min_stock_level
+        )
+        metrics.alerts_queued.inc_on_commit()
 
     class Meta:
         ordering = ['name']
+        indexes = [
+            # Active products by name, covering the dashboard stock queries
+            models.Index(fields=['is_active', 'name', 'stock_quantity', 'min_stock_level'],
+                         name='product_active_name_idx'),
+            # Catalog delta sync and its watermark
+            models.Index(fields=['updated_at'], name='product_updated_idx'),
+            # Default ordering: the changelist and the admin filters listing products
+            models.Index(fields=['name'], name='product_name_idx'),
+        ]
 
 class Customer(models.Model):
     name = models.CharField(max_length=100)
@@ -116,6 +126,11 @@ class Customer(models.Model):
 
     class Meta:
         ordering = ['name']
+        indexes = [
+            models.Index(fields=['created_at'], name='customer_created_idx'),
+            # Default ordering: the changelist and the sale changelist's customer filter
+            models.Index(fields=['name'], name='customer_name_idx'),
+        ]
 
 class Sale(models.Model):
     date = models.DateTimeField(auto_now_add=True)
@@ -131,38 +146,64 @@ class Sale(models.Model):
     def calculate_profit(self):
         return sum(item.profit for item in self.items.all())
 
-    def save(self, *args, **kwargs):
-        if not self.pk:
-            super().save(*args, **kwargs)
-        else:
-            self.total_amount = sum(item.price_at_sale * item.quantity for item in self.items.all())
-            self.profit = self.calculate_profit()
-            super().save(*args, **kwargs)
+    def apply_totals_delta(self, amount, profit):
+        """
+        Add a line's contribution to the stored totals with a single UPDATE,
+        without re-reading the other items of the sale.
+        """
+        if amount or profit:
+            Sale.objects.filter(pk=self.pk).update(
+                total_amount=F('total_amount') + amount,
+                profit=F('profit') + profit
+            )
+
+    def recalculate_totals(self):
+        """Recompute total_amount and profit from all items, e.g. to repair drifted totals."""
+        money = models.DecimalField(max_digits=10, decimal_places=2)
+        cents = Decimal('0.01')
+        totals = self.items.aggregate(
+            total_amount=Sum(F('price_at_sale') * F('quantity'), output_field=money),
+            profit=Sum(
+                (F('price_at_sale') - Coalesce('purchase_price_at_sale', 'product__purchase_price'))
+                * F('quantity'),
+                output_field=money
+            )
+        )
+        self.total_amount = (totals['total_amount'] or Decimal('0.00')).quantize(cents)
+        self.profit = (totals['profit'] or Decimal('0.00')).quantize(cents)
+        Sale.objects.filter(pk=self.pk).update(total_amount=self.total_amount, profit=self.profit)
 
     def delete(self, *args, **kwargs):
-        print(f"DEBUG: Deleting entire sale #{self.id}")
+        logger.debug('Deleting entire sale #%s', self.pk)
         # Store all sale items before deletion to restore stock
         items_to_restore = list(self.items.all())
         
         with transaction.atomic():
+            # Take the sale out of the daily rollups
+            rollups.record(rollups.deltas_for_items(self.items.all(), sign=-1))
+
             # First restore all stock
             for item in items_to_restore:
-                print(f"DEBUG: Restoring {item.quantity} units of {item.product.name}")
                 actual_change = item.product.update_stock(item.quantity)
                 if actual_change != item.quantity:
-                    print(f"DEBUG: Warning: Could not fully restore stock for {item.product.name}. Expected +{item.quantity}, actual +{actual_change}")
+                    logger.warning('Could not fully restore stock for product %s: expected +%s, actual +%s',
+                                   item.product_id, item.quantity, actual_change)
             
             # Then delete the sale (this will cascade delete the items)
             super().delete(*args, **kwargs)
 
     class Meta:
         ordering = ['-date']
+        indexes = [
+            models.Index(fields=['-date'], name='sale_date_idx'),
+        ]
 
 class SaleItem(models.Model):
     sale = models.ForeignKey(Sale, on_delete=models.CASCADE, related_name='items')
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
     quantity = models.IntegerField(validators=[MinValueValidator(1)])
     price_at_sale = models.DecimalField(max_digits=10, decimal_places=2, validators=[MinValueValidator(Decimal('0.01'))])
+    purchase_price_at_sale = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True, editable=False)
 
     def __str__(self):
         return f"{self.product.name} x {self.quantity}"
@@ -203,23 +244,14 @@ class SaleItem(models.Model):
                 stock_change = self.quantity - original_quantity
                 # When editing, we need to consider the original quantity as available
                 available_stock += original_quantity  # Add back the original quantity since it's already "reserved"
-                print(f"DEBUG: Editing sale item {self.pk}")
-                print(f"DEBUG: Original quantity: {original_quantity}")
-                print(f"DEBUG: New quantity: {self.quantity}")
-                print(f"DEBUG: Available stock (including original): {available_stock}")
-                print(f"DEBUG: Stock change needed: {stock_change}")
             except SaleItem.DoesNotExist:
                 # Handle the case where the item doesn't exist anymore
                 stock_change = self.quantity
-                print(f"DEBUG: Original sale item not found")
-                print(f"DEBUG: New quantity: {self.quantity}")
-                print(f"DEBUG: Available stock: {available_stock}")
         else:
             # For new items
             stock_change = self.quantity
-            print(f"DEBUG: New sale item")
-            print(f"DEBUG: New quantity: {self.quantity}")
-            print(f"DEBUG: Available stock: {available_stock}")
+        logger.debug('Sale item %s: quantity %s, stock change %s, available %s',
+                     self.pk, self.quantity, stock_change, available_stock)
 
         # Check if there's enough stock
         if stock_change > available_stock:
@@ -232,24 +264,24 @@ class SaleItem(models.Model):
         self.clean()
 
         # Store the original state
+        original = None
         if self.pk:
             try:
                 original = SaleItem.objects.get(pk=self.pk)
                 original_quantity = original.quantity
-                print(f"DEBUG: Save - Original quantity: {original_quantity}")
             except SaleItem.DoesNotExist:
                 original_quantity = 0
-                print(f"DEBUG: Save - No original item found")
         else:
             original_quantity = 0
-            print(f"DEBUG: Save - New item")
-
-        print(f"DEBUG: Save - New quantity: {self.quantity}")
 
         # Set price_at_sale if not set
         if not self.price_at_sale and self.product:
             self.price_at_sale = self.product.selling_price
 
+        # Snapshot the purchase price so the line's profit is fixed once sold
+        if self.purchase_price_at_sale is None and self.product:
+            self.purchase_price_at_sale = self.product.purchase_price
+
         # Save the instance and update stock in a transaction
         with transaction.atomic():
             super().save(*args, **kwargs)
@@ -264,10 +296,29 @@ class SaleItem(models.Model):
                     notes=f'Sale #{self.sale.id}'
                 )
                 if actual_change != -quantity_difference:
-                    print(f"DEBUG: Save - Warning: Could not apply full stock change")
-
-            # Update sale total
-            self.sale.save()
+                    logger.warning('Could not apply full stock change for sale item %s: expected %s, actual %s',
+                                   self.pk, -quantity_difference, actual_change)
+
+            # Apply only this line's change to the sale totals
+            amount, profit = self.totals_contribution()
+            original_amount = original_profit = Decimal('0.00')
+            if original is not None:
+                original_amount, original_profit = original.totals_contribution()
+            self.sale.apply_totals_delta(amount - original_amount, profit - original_profit)
+
+            if original is None or original.product_id == self.product_id:
+                deltas = [rollups.line_delta(
+                    self.sale, self.product, quantity_difference,
+                    amount - original_amount, profit - original_profit,
+                )]
+            else:
+                # A changed product moves the whole line between products
+                deltas = [
+                    rollups.line_delta(original.sale, original.product, -original.quantity,
+                                       -original_amount, -original_profit),
+                    rollups.line_delta(self.sale, self.product, self.quantity, amount, profit),
+                ]
+            rollups.record(deltas)
 
     def delete(self, *args, **kwargs):
         # Store references before deletion
@@ -275,25 +326,42 @@ class SaleItem(models.Model):
         quantity = self.quantity
         sale_id = self.sale_id
         
-        print(f"DEBUG: Delete - Restoring {quantity} units to product {product.name}")
-        
+        amount, profit = self.totals_contribution()
+
         # Delete the sale item and restore stock in a transaction
         with transaction.atomic():
+            # Remove the line, net of its returns, from the daily rollups
+            rollups.record(rollups.deltas_for_items(SaleItem.objects.filter(pk=self.pk), sign=-1))
             super().delete(*args, **kwargs)
+            Sale(pk=sale_id).apply_totals_delta(-amount, -profit)
             
             # Restore the stock quantity using update_stock
             actual_change = product.update_stock(quantity)  # Positive quantity to increase stock
             if actual_change != quantity:
-                print(f"DEBUG: Delete - Warning: Could not fully restore stock. Expected +{quantity}, actual +{actual_change}")
+                logger.warning('Could not fully restore stock for product %s: expected +%s, actual +%s',
+                               product.pk, quantity, actual_change)
 
     @property
     def profit(self):
-        if not all([self.quantity, self.price_at_sale, self.product, self.product.purchase_price]):
+        purchase_price = self.purchase_price_at_sale
+        if purchase_price is None and self.product_id:
+            purchase_price = self.product.purchase_price
+        if not all([self.quantity, self.price_at_sale, purchase_price]):
             return Decimal('0.00')
-        return (self.price_at_sale - self.product.purchase_price) * self.quantity
+        return (self.price_at_sale - purchase_price) * self.quantity
+
+    def totals_contribution(self):
+        """Return the (amount, profit) this line adds to its sale's totals."""
+        if not self.quantity or not self.price_at_sale:
+            return Decimal('0.00'), Decimal('0.00')
+        return self.price_at_sale * self.quantity, self.profit
 
     class Meta:
         ordering = ['-sale__date']
+        indexes = [
+            # Per-product lines of the sales in a date window
+            models.Index(fields=['sale', 'product'], name='saleitem_sale_product_idx'),
+        ]
 
 class StockTransaction(models.Model):
     TRANSACTION_TYPES = [
@@ -317,24 +385,14 @@ class StockTransaction(models.Model):
         direction = "IN" if self.is_increase else "OUT"
         return f"{self.transaction_type} {direction}: {self.product.name} x {self.quantity}"
 
-    def clean(self):
-        if not self.pk:  # Only for new transactions
-            current_stock = self.product.stock_quantity
-            quantity_change = self.quantity if self.is_increase else -self.quantity
-            new_stock = current_stock + quantity_change
-            
-            if new_stock < 0:
-                raise ValidationError({
-                    'quantity': f'Cannot reduce stock below 0. Current stock: {current_stock}'
-                })
-            
-            if self.is_increase and new_stock > self.product.max_stock_level:
-                raise ValidationError({
-                    'quantity': f'Cannot exceed maximum stock level of {self.product.max_stock_level}'
-                })
-
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Per-product history, newest first (keyset pagination in history.py)
+            models.Index(fields=['product', '-created_at', '-id'], name='stocktx_product_created_idx'),
+            # Ledger changelist, newest first
+            models.Index(fields=['-created_at'], name='stocktx_created_idx'),
+        ]
 
 class ProductPriceHistory(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='price_history')
@@ -348,9 +406,78 @@ class ProductPriceHistory(models.Model):
 
     class Meta:
         ordering = ['-changed_at']
+        indexes = [
+            # Latest price of a product (track_price_changes)
+            models.Index(fields=['product', '-changed_at'], name='pricehistory_product_idx'),
+            # Price history changelist, newest first
+            models.Index(fields=['-changed_at'], name='pricehistory_changed_idx'),
+        ]
         verbose_name = 'Product Price History'
         verbose_name_plural = 'Product Price Histories'
 
+class StockAlert(models.Model):
+    """Outbox row for a low stock alert, delivered by the process_alerts command."""
+    STATUS_CHOICES = [
+        ('PENDING', 'Pending'),
+        ('SENT', 'Sent'),
+        ('FAILED', 'Failed'),
+    ]
+
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='stock_alerts')
+    stock_quantity = models.IntegerField()
+    min_stock_level = models.IntegerField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='PENDING')
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Low stock: {self.product.name} ({self.stock_quantity}/{self.min_stock_level})"
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            # Pending alerts per product and recent deliveries (alerts.py)
+            models.Index(fields=['product', '-created_at'], condition=models.Q(status='PENDING'),
+                         name='stockalert_pending_idx'),
+            models.Index(fields=['status', 'sent_at'], name='stockalert_status_sent_idx'),
+            # Alert changelist, newest first
+            models.Index(fields=['-created_at'], name='stockalert_created_idx'),
+        ]
+
+class IdempotencyKey(models.Model):
+    """
+    Result of a POS request sent with an Idempotency-Key header. Retries with
+    the same key get the stored response instead of creating another sale.
+    """
+    key = models.CharField(max_length=255, unique=True)
+    request_hash = models.CharField(max_length=64)
+    sale = models.ForeignKey(Sale, on_delete=models.SET_NULL, null=True, blank=True, related_name='idempotency_keys')
+    status_code = models.PositiveSmallIntegerField(default=200)
+    response = models.JSONField()
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return self.key
+
+    class Meta:
+        ordering = ['-created_at']
+
+class DeletedProduct(models.Model):
+    """
+    Tombstone of a deleted barcoded product. The POS catalog sync (catalog.py)
+    sends these ids to clients so they drop the product from their copy.
+    """
+    product_id = models.BigIntegerField()
+    deleted_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return f'Product #{self.product_id}'
+
+    class Meta:
+        ordering = ['-deleted_at']
+
 class SaleReturn(models.Model):
     sale_item = models.ForeignKey('SaleItem', on_delete=models.CASCADE, related_name='returns')
     quantity = models.IntegerField(validators=[MinValueValidator(1)])
@@ -370,6 +497,7 @@ class SaleReturn(models.Model):
             self.refund_amount = self.sale_item.price_at_sale * self.quantity
             with transaction.atomic():
                 super().save(*args, **kwargs)
+                rollups.record([self.rollup_delta(sign=-1)])
                 # Update stock
                 self.sale_item.product.update_stock(
                     self.quantity,
@@ -388,6 +516,7 @@ class SaleReturn(models.Model):
         # Delete the return and update stock in a transaction
         with transaction.atomic():
             super().delete(*args, **kwargs)
+            rollups.record([self.rollup_delta(sign=1)])
             
             # Decrease the stock since the return is being cancelled
             actual_change = product.update_stock(
@@ -396,13 +525,101 @@ class SaleReturn(models.Model):
                 notes=f'Cancelled return from Sale #{sale_id}'
             )
             if actual_change != -quantity:
-                print(f"Warning: Could not fully adjust stock. Expected -{quantity}, actual {actual_change}")
+                logger.warning('Could not fully adjust stock for product %s: expected -%s, actual %s',
+                               product.pk, quantity, actual_change)
+
+    def rollup_delta(self, sign):
+        """The rollup delta for this return; returns count against the original sale day."""
+        item = self.sale_item
+        unit_cost = item.purchase_price_at_sale
+        if unit_cost is None:
+            unit_cost = item.product.purchase_price
+        return rollups.RollupDelta(
+            rollups.sale_day(item.sale), item.product_id, item.product.category_id,
+            sign * self.quantity, sign * self.refund_amount, sign * unit_cost * self.quantity
+        )
 
     def __str__(self):
         return f"Return: {self.sale_item.product.name} x {self.quantity} from Sale #{self.sale_item.sale.id}"
 
     class Meta:
         ordering = ['-processed_at']
+        indexes = [
+            # Return changelist, newest first
+            models.Index(fields=['-processed_at'], name='salereturn_processed_idx'),
+        ]
+
+class DailyProductSales(models.Model):
+    """Per-day sales rollup for one product, maintained by inventory.rollups."""
+    date = models.DateField()
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='daily_sales')
+    units = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal('0.00'))
+    cost = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal('0.00'))
+    profit = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal('0.00'))
+
+    def __str__(self):
+        return f"{self.product.name} - {self.date}"
+
+    class Meta:
+        ordering = ['-date']
+        verbose_name_plural = 'Daily product sales'
+        constraints = [
+            models.UniqueConstraint(fields=['date', 'product'], name='unique_daily_product_sales'),
+        ]
+
+class DailyCategorySales(models.Model):
+    """Per-day sales rollup for one category, maintained by inventory.rollups."""
+    date = models.DateField()
+    category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True, related_name='daily_sales')
+    units = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal('0.00'))
+    cost = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal('0.00'))
+    profit = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal('0.00'))
+
+    def __str__(self):
+        return f"{self.category.name if self.category else 'Uncategorized'} - {self.date}"
+
+    class Meta:
+        ordering = ['-date']
+        verbose_name_plural = 'Daily category sales'
+        constraints = [
+            models.UniqueConstraint(fields=['date', 'category'], name='unique_daily_category_sales'),
+        ]
+
+# Invalidate cached dashboard charts whenever their source data changes
+@receiver(post_save, sender=Sale)
+@receiver(post_delete, sender=Sale)
+@receiver(post_save, sender=SaleItem)
+@receiver(post_delete, sender=SaleItem)
+@receiver(post_save, sender=SaleReturn)
+@receiver(post_delete, sender=SaleReturn)
+@receiver(post_save, sender=StockTransaction)
+@receiver(post_delete, sender=StockTransaction)
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=Customer)
+@receiver(post_delete, sender=Customer)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def bump_chart_data_version(sender, **kwargs):
+    caching.bump_data_version()
+
+# Deleting a customer or product cascades to its sales and sale items without
+# running SaleItem.delete, so take them out of the daily rollups first (inside
+# the deletion's transaction)
+@receiver(pre_delete, sender=Customer)
+def remove_customer_sales_from_rollups(sender, instance, **kwargs):
+    rollups.record(rollups.deltas_for_items(SaleItem.objects.filter(sale__customer=instance), sign=-1))
+
+@receiver(pre_delete, sender=Product)
+def remove_product_sales_from_rollups(sender, instance, **kwargs):
+    rollups.record(rollups.deltas_for_items(SaleItem.objects.filter(product=instance), sign=-1))
+
+@receiver(post_delete, sender=Product)
+def record_product_deletion(sender, instance, **kwargs):
+    from . import catalog
+    catalog.record_deletion(instance)
 
 # Signal to track price changes
 @receiver(post_save, sender=Product)
@@ -424,6 +641,8 @@ def track_price_changes(sender, instance, created, **kwargs):
 @receiver(post_delete, sender=SaleItem)
 def check_and_delete_empty_sale(sender, instance, **kwargs):
     """Delete sales that have no items after a sale item is deleted."""
+    if _empty_sale_cleanup_deferred.get():
+        return
     try:
         # Get the sale and check if it exists and has no items
         sale = Sale.objects.get(pk=instance.sale_id)
@@ -0,0 +1,165 @@
+"""
+Per-endpoint request statistics.
+
+``QueryStatsMiddleware`` counts the queries and database time of every
+request through ``connection.execute_wrapper``, so it works with ``DEBUG``
+off, and records them with the total time and response size under the
+resolved URL name (e.g. ``inventory:dashboard_data`` or
+``admin:inventory_sale_changelist``).
+
+Each process keeps the last ``ENDPOINT_STATS_SAMPLES`` requests per endpoint
+in memory and writes them to ``ENDPOINT_STATS_DIR/<pid>.json`` at most every
+``ENDPOINT_STATS_DUMP_INTERVAL`` seconds. ``summary()`` merges the dumps of
+every worker into percentiles; the staff endpoint and the ``endpoint_stats``
+command both report it.
+"""
+
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connections
+
+METRICS = ('queries', 'db_ms', 'total_ms', 'bytes')
+PERCENTILES = (50, 95, 99)
+
+_lock = threading.Lock()
+_samples = {}
+_requests = {}
+_last_dump = 0.0
+
+
+class QueryCounter:
+    """``execute_wrapper`` that counts queries and their time in milliseconds."""
+
+    def __init__(self):
+        self.queries = 0
+        self.db_ms = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.db_ms += (time.perf_counter() - start) * 1000
+
+
+@contextmanager
+def count_queries(counter):
+    """Install ``counter`` on every configured database connection for the ``with`` block."""
+    installed = []
+    try:
+        for connection in connections.all():
+            connection.execute_wrappers.append(counter)
+            installed.append(connection)
+        yield counter
+    finally:
+        # Remove by identity: wrappers added meanwhile (e.g. the slow query
+        # log's, on a connection opened inside the block) stay installed
+        for connection in installed:
+            for i in range(len(connection.execute_wrappers) - 1, -1, -1):
+                if connection.execute_wrappers[i] is counter:
+                    del connection.execute_wrappers[i]
+                    break
+
+
+def record(endpoint, queries, db_ms, total_ms, size):
+    with _lock:
+        samples = _samples.get(endpoint)
+        if samples is None:
+            samples = _samples[endpoint] = deque(maxlen=settings.ENDPOINT_STATS_SAMPLES)
+        samples.append((queries, round(db_ms, 3), round(total_ms, 3), size))
+        _requests[endpoint] = _requests.get(endpoint, 0) + 1
+
+
+def snapshot():
+    """This process's statistics as ``{endpoint: {'requests': n, 'samples': [...]}}``."""
+    with _lock:
+        return {
+            endpoint: {'requests': _requests[endpoint], 'samples': list(samples)}
+            for endpoint, samples in _samples.items()
+        }
+
+
+def reset():
+    """Forget this process's statistics and delete every dump."""
+    global _last_dump
+    with _lock:
+        _samples.clear()
+        _requests.clear()
+        _last_dump = 0.0
+    for path in _dump_dir().glob('*.json'):
+        path.unlink(missing_ok=True)
+
+
+def _dump_dir():
+    return Path(settings.ENDPOINT_STATS_DIR)
+
+
+def dump():
+    """Write this process's statistics to its dump file."""
+    global _last_dump
+    directory = _dump_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+    path = directory / f'{os.getpid()}.json'
+    tmp = path.with_suffix('.tmp')
+    tmp.write_text(json.dumps({'pid': os.getpid(), 'time': time.time(), 'endpoints': snapshot()}))
+    os.replace(tmp, path)
+    _last_dump = time.monotonic()
+
+
+def maybe_dump():
+    if time.monotonic() - _last_dump >= settings.ENDPOINT_STATS_DUMP_INTERVAL:
+        dump()
+
+
+def load_dumps(max_age=None):
+    """Every worker's dump, skipping those older than ``max_age`` seconds."""
+    now = time.time()
+    dumps = []
+    for path in sorted(_dump_dir().glob('*.json')):
+        try:
+            data = json.loads(path.read_text())
+        except (OSError, ValueError):
+            # Removed or replaced while reading
+            continue
+        if max_age is None or now - data.get('time', 0) <= max_age:
+            dumps.append(data)
+    return dumps
+
+
+def _percentile(ordered, pct):
+    index = max(0, -(-len(ordered) * pct // 100) - 1)
+    return ordered[index]
+
+
+def summarize(dumps):
+    """Merge dumps into ``{endpoint: {'requests', 'samples', <metric>: {p50, p95, p99, max}}}``."""
+    merged = {}
+    for data in dumps:
+        for endpoint, stats in data['endpoints'].items():
+            entry = merged.setdefault(endpoint, {'requests': 0, 'samples': []})
+            entry['requests'] += stats['requests']
+            entry['samples'].extend(stats['samples'])
+
+    summary = {}
+    for endpoint, entry in sorted(merged.items()):
+        row = {'requests': entry['requests'], 'samples': len(entry['samples'])}
+        for position, metric in enumerate(METRICS):
+            ordered = sorted(sample[position] for sample in entry['samples'])
+            row[metric] = {f'p{pct}': _percentile(ordered, pct) for pct in PERCENTILES}
+            row[metric]['max'] = ordered[-1]
+        summary[endpoint] = row
+    return summary
+
+
+def summary():
+    """Statistics of every live worker, this one included."""
+    dump()
+    return summarize(load_dumps(max_age=settings.ENDPOINT_STATS_MAX_AGE))
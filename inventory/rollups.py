@@ -0,0 +1,247 @@
+"""
+Daily sales rollups.
+
+``DailyProductSales`` and ``DailyCategorySales`` hold units, revenue, cost and
+profit per day. The sale and return write paths push signed deltas into them
+with ``record``, and ``rebuild`` recomputes them from the raw rows (see the
+``rebuild_rollups`` command). Dashboard charts read the rollups, so their cost
+depends on days x products rather than on the number of sale lines.
+
+Rows are bucketed by the sale date in the current time zone and by the
+product's category at the time the delta is recorded.
+"""
+
+from collections import namedtuple
+from datetime import datetime, time
+from decimal import Decimal
+
+from django.db import IntegrityError, connections, router, transaction
+from django.db.models import DecimalField, F, Sum
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils import timezone
+
+from . import caching
+from .instrumentation import timed
+
+RollupDelta = namedtuple('RollupDelta', ['date', 'product_id', 'category_id', 'units', 'revenue', 'cost'])
+
+ZERO = Decimal('0.00')
+
+
+def _models():
+    from .models import DailyCategorySales, DailyProductSales
+    return DailyProductSales, DailyCategorySales
+
+
+def sale_day(sale):
+    return timezone.localdate(sale.date)
+
+
+def _merge(deltas, key):
+    merged = {}
+    for delta in deltas:
+        k = key(delta)
+        units, revenue, cost = merged.get(k, (0, ZERO, ZERO))
+        merged[k] = (units + delta.units, revenue + delta.revenue, cost + delta.cost)
+    return {k: v for k, v in merged.items() if any(v)}
+
+
+def _supports_upsert(connection):
+    if connection.vendor == 'postgresql':
+        return True
+    if connection.vendor == 'sqlite':
+        return connection.Database.sqlite_version_info >= (3, 24, 0)
+    return False
+
+
+def _upsert(connection, model, key_field, rows):
+    """
+    Add ``rows`` ({(date, key): (units, revenue, cost)}) to ``model`` with a
+    single INSERT ... ON CONFLICT DO UPDATE that increments existing counters.
+    """
+    opts = model._meta
+    qn = connection.ops.quote_name
+    columns = {name: qn(opts.get_field(name).column) for name in
+               ('date', key_field, 'units', 'revenue', 'cost', 'profit')}
+    table = qn(opts.db_table)
+    values_sql = ', '.join(['(%s, %s, %s, %s, %s, %s)'] * len(rows))
+    params = []
+    for (day, key), (units, revenue, cost) in rows.items():
+        params += [
+            connection.ops.adapt_datefield_value(day), key, units,
+            connection.ops.adapt_decimalfield_value(revenue, 12, 2),
+            connection.ops.adapt_decimalfield_value(cost, 12, 2),
+            connection.ops.adapt_decimalfield_value(revenue - cost, 12, 2),
+        ]
+    increments = ', '.join(
+        '{col} = {table}.{col} + excluded.{col}'.format(col=columns[name], table=table)
+        for name in ('units', 'revenue', 'cost', 'profit')
+    )
+    sql = (
+        'INSERT INTO {table} ({date}, {key}, {units}, {revenue}, {cost}, {profit}) '
+        'VALUES {values} ON CONFLICT ({date}, {key}) DO UPDATE SET {increments}'
+    ).format(table=table, key=columns[key_field], values=values_sql, increments=increments,
+             **{name: columns[name] for name in ('date', 'units', 'revenue', 'cost', 'profit')})
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+
+
+def _increment(using, model, key_field, rows):
+    """Portable update-then-insert fallback, also used for NULL keys."""
+    manager = model.objects.using(using)
+    for (day, key), (units, revenue, cost) in rows.items():
+        increments = dict(
+            units=F('units') + units,
+            revenue=F('revenue') + revenue,
+            cost=F('cost') + cost,
+            profit=F('profit') + (revenue - cost),
+        )
+        lookup = {'date': day, key_field: key}
+        if manager.filter(**lookup).update(**increments):
+            continue
+        try:
+            with transaction.atomic(using=using):
+                manager.create(units=units, revenue=revenue, cost=cost, profit=revenue - cost, **lookup)
+        except IntegrityError:
+            # Another writer created the row first
+            manager.filter(**lookup).update(**increments)
+
+
+def _apply(using, model, key_field, rows):
+    connection = connections[using]
+    keyed = {k: v for k, v in rows.items() if k[1] is not None}
+    unkeyed = {k: v for k, v in rows.items() if k[1] is None}
+    if keyed and _supports_upsert(connection):
+        _upsert(connection, model, key_field, keyed)
+    elif keyed:
+        _increment(using, model, key_field, keyed)
+    if unkeyed:
+        _increment(using, model, key_field, unkeyed)
+
+
+@timed('rollups.record')
+def record(deltas):
+    """
+    Apply signed ``RollupDelta`` values to both rollup tables. Deltas for the
+    same day and product (or category) are merged first, so each rollup row is
+    written at most once per call.
+    """
+    DailyProductSales, DailyCategorySales = _models()
+    deltas = list(deltas)
+    if not deltas:
+        return
+    product_rows = _merge(deltas, lambda d: (d.date, d.product_id))
+    category_rows = _merge(deltas, lambda d: (d.date, d.category_id))
+    using = router.db_for_write(DailyProductSales)
+    with transaction.atomic(using=using):
+        if product_rows:
+            _apply(using, DailyProductSales, 'product_id', product_rows)
+        if category_rows:
+            _apply(using, DailyCategorySales, 'category_id', category_rows)
+        caching.bump_data_version()
+
+
+def line_delta(sale, product, units, revenue, profit):
+    """Build the delta for a change to one sale line."""
+    return RollupDelta(sale_day(sale), product.pk, product.category_id, units, revenue, revenue - profit)
+
+
+def deltas_for_items(items, sign=1):
+    """
+    Aggregate a SaleItem queryset into rollup deltas, net of any returns
+    against those items, with two grouped queries. ``sign=-1`` produces the
+    deltas that remove the items from the rollups, e.g. before deleting them.
+    """
+    from .models import SaleReturn
+
+    money = DecimalField(max_digits=12, decimal_places=2)
+    unit_cost = Coalesce('purchase_price_at_sale', 'product__purchase_price')
+    sold = (
+        items.order_by()
+        .annotate(day=TruncDate('sale__date'))
+        .values('day', 'product_id', 'product__category_id')
+        .annotate(
+            total_units=Sum('quantity'),
+            total_revenue=Sum(F('price_at_sale') * F('quantity'), output_field=money),
+            total_cost=Sum(unit_cost * F('quantity'), output_field=money),
+        )
+    )
+    returned = (
+        SaleReturn.objects.filter(sale_item__in=items.order_by().values('pk'))
+        .order_by()
+        .annotate(day=TruncDate('sale_item__sale__date'))
+        .values('day', 'sale_item__product_id', 'sale_item__product__category_id')
+        .annotate(
+            total_units=Sum('quantity'),
+            total_revenue=Sum('refund_amount'),
+            total_cost=Sum(
+                Coalesce('sale_item__purchase_price_at_sale', 'sale_item__product__purchase_price')
+                * F('quantity'),
+                output_field=money,
+            ),
+        )
+    )
+
+    deltas = []
+    for row in sold:
+        deltas.append(RollupDelta(
+            row['day'], row['product_id'], row['product__category_id'],
+            sign * row['total_units'], sign * row['total_revenue'], sign * row['total_cost'],
+        ))
+    for row in returned:
+        deltas.append(RollupDelta(
+            row['day'], row['sale_item__product_id'], row['sale_item__product__category_id'],
+            -sign * row['total_units'], -sign * row['total_revenue'], -sign * row['total_cost'],
+        ))
+    return deltas
+
+
+def rebuild(since=None):
+    """
+    Recompute the rollups from raw sales, from ``since`` (a date) onwards or
+    entirely when ``since`` is None. Returns the number of product rows
+    written.
+    """
+    from .models import SaleItem
+
+    DailyProductSales, DailyCategorySales = _models()
+    items = SaleItem.objects.all()
+    product_rows = DailyProductSales.objects.all()
+    category_rows = DailyCategorySales.objects.all()
+    if since is not None:
+        # Compare the raw column (not its date) so the sale date index applies
+        start = timezone.make_aware(datetime.combine(since, time.min))
+        items = items.filter(sale__date__gte=start)
+        product_rows = product_rows.filter(date__gte=since)
+        category_rows = category_rows.filter(date__gte=since)
+
+    using = router.db_for_write(DailyProductSales)
+    with transaction.atomic(using=using):
+        # Hold off concurrent record() calls until the rebuilt rows are
+        # committed, so a sale committing meanwhile is added on top of them
+        # instead of being lost. On SQLite the DELETE takes the write lock.
+        connection = connections[using]
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('LOCK TABLE {}, {} IN SHARE ROW EXCLUSIVE MODE'.format(
+                    connection.ops.quote_name(DailyProductSales._meta.db_table),
+                    connection.ops.quote_name(DailyCategorySales._meta.db_table),
+                ))
+        product_rows.delete()
+        category_rows.delete()
+
+        deltas = deltas_for_items(items)
+        by_product = _merge(deltas, lambda d: (d.date, d.product_id))
+        by_category = _merge(deltas, lambda d: (d.date, d.category_id))
+        DailyProductSales.objects.bulk_create([
+            DailyProductSales(date=day, product_id=key, units=units, revenue=revenue,
+                              cost=cost, profit=revenue - cost)
+            for (day, key), (units, revenue, cost) in by_product.items()
+        ], batch_size=500)
+        DailyCategorySales.objects.bulk_create([
+            DailyCategorySales(date=day, category_id=key, units=units, revenue=revenue,
+                               cost=cost, profit=revenue - cost)
+            for (day, key), (units, revenue, cost) in by_category.items()
+        ], batch_size=500)
+        caching.bump_data_version()
+    return len(by_product)
@@ -0,0 +1,80 @@
+"""
+Read-replica routing.
+
+When ``settings.DATABASES`` has a ``replica`` alias, reads made while
+``read_from_replica()`` is active go to it; everything else, and every read
+inside a transaction on ``default``, stays on ``default``. Views opt in with
+``@replica_view`` and ``ReplicaRoutingMiddleware`` activates the replica for
+them (and for admin changelists) unless the client wrote recently.
+"""
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+REPLICA_DB_ALIAS = 'replica'
+
+# Sessions and users are read on every request and must reflect logins and
+# permission changes at once, so they always come from the primary.
+PRIMARY_ONLY_APPS = {'auth', 'sessions', 'contenttypes', 'admin'}
+
+_replica_reads = ContextVar('replica_reads', default=False)
+
+
+def replica_configured():
+    return REPLICA_DB_ALIAS in settings.DATABASES
+
+
+def activate_replica_reads():
+    """Start routing reads to the replica; pass the token to ``deactivate_replica_reads``."""
+    return _replica_reads.set(True)
+
+
+def deactivate_replica_reads(token):
+    _replica_reads.reset(token)
+
+
+@contextmanager
+def read_from_replica():
+    """Send the reads of the enclosed block to the replica, if there is one."""
+    token = activate_replica_reads()
+    try:
+        yield
+    finally:
+        deactivate_replica_reads(token)
+
+
+def replica_view(view):
+    """Mark a read-only view whose queries may be served by the replica."""
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        return view(request, *args, **kwargs)
+    wrapper.use_replica = True
+    return wrapper
+
+
+class ReplicaRouter:
+    """Route opted-in reads to ``replica``; writes, and reads in write transactions, to ``default``."""
+
+    def db_for_read(self, model, **hints):
+        if not _replica_reads.get() or not replica_configured():
+            return DEFAULT_DB_ALIAS
+        if model._meta.app_label in PRIMARY_ONLY_APPS:
+            return DEFAULT_DB_ALIAS
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return REPLICA_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Both aliases hold the same data
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # The replica receives its schema from the primary
+        return db == DEFAULT_DB_ALIAS
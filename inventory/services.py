@@ -0,0 +1,279 @@
+"""
+Write paths that touch many rows at once.
+
+These functions bypass the per-instance ``save()`` logic of the models and
+work on whole sets of rows, so their query count does not grow with the
+number of lines involved.
+"""
+
+import hashlib
+import json
+from collections import OrderedDict, namedtuple
+from decimal import Decimal
+
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, models, transaction
+from django.db.models import F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+from . import alerts, metrics, rollups, stock
+from .instrumentation import timed
+from .models import IdempotencyKey, Product, Sale, SaleItem, deferred_empty_sale_cleanup
+
+# Outcome of one POS sale request: HTTP status, JSON body, and whether the
+# body was replayed from an earlier request with the same idempotency key.
+SaleResult = namedtuple('SaleResult', ['status', 'body', 'replayed'])
+
+# Sales committed per transaction by create_sales_bulk
+SALE_BATCH_SIZE = 50
+
+# Bounds of the BigAutoField primary key and the IntegerField quantities
+MAX_PRODUCT_ID = 2 ** 63 - 1
+MAX_QUANTITY = 2 ** 31 - 1
+
+
+def _parse_lines(lines):
+    """Validate raw POS lines and return [(product_id, quantity)]."""
+    if not isinstance(lines, list):
+        raise ValidationError('Items must be a list.')
+    parsed = []
+    for line in lines:
+        try:
+            product_id = int(line.get('product_id'))
+            quantity = int(line.get('quantity', 1))
+        except (AttributeError, TypeError, ValueError, OverflowError):
+            raise ValidationError('Each item needs a numeric product_id and quantity.')
+        if quantity <= 0:
+            raise ValidationError('Quantity must be greater than 0.')
+        # Larger values overflow the database's integer columns
+        if not 0 < product_id <= MAX_PRODUCT_ID:
+            raise ValidationError(f'Product not found: {product_id}')
+        if quantity > MAX_QUANTITY:
+            raise ValidationError(f'Quantity must be at most {MAX_QUANTITY}.')
+        parsed.append((product_id, quantity))
+    return parsed
+
+
+@timed('sale.create')
+def create_sale(lines, customer=None, is_paid=True):
+    """
+    Create a sale from a list of ``{'product_id': ..., 'quantity': ...}``
+    lines using a fixed number of queries regardless of basket size.
+
+    Products are loaded in one query, stock for every product is decremented
+    with one guarded UPDATE (which also enforces availability), and the sale
+    items and SALE ledger rows are each written with a single bulk insert.
+    Raises ``ValidationError`` for unknown products or insufficient stock;
+    nothing is written in that case.
+    """
+    lines = _parse_lines(lines)
+    if not lines:
+        raise ValidationError('No items in sale')
+
+    quantities = OrderedDict()
+    for product_id, quantity in lines:
+        quantities[product_id] = quantities.get(product_id, 0) + quantity
+
+    with transaction.atomic():
+        products = Product.objects.in_bulk(list(quantities))
+        missing = [pk for pk in quantities if pk not in products]
+        if missing:
+            raise ValidationError(f'Product not found: {", ".join(map(str, missing))}')
+
+        total_amount = Decimal('0.00')
+        profit = Decimal('0.00')
+        for product_id, quantity in lines:
+            product = products[product_id]
+            total_amount += product.selling_price * quantity
+            profit += (product.selling_price - product.purchase_price) * quantity
+
+        sale = Sale.objects.create(
+            customer=customer,
+            is_paid=is_paid,
+            total_amount=total_amount,
+            profit=profit,
+        )
+
+        changes = stock.apply_stock_changes(
+            {product_id: -quantity for product_id, quantity in quantities.items()}
+        )
+
+        SaleItem.objects.bulk_create([
+            SaleItem(
+                sale=sale,
+                product=products[product_id],
+                quantity=quantity,
+                price_at_sale=products[product_id].selling_price,
+                purchase_price_at_sale=products[product_id].purchase_price,
+            )
+            for product_id, quantity in lines
+        ])
+        stock.record_stock_transactions(
+            changes.values(), transaction_type='SALE', notes=f'Sale #{sale.id}'
+        )
+
+        alerts.queue_low_stock_alerts(changes.values())
+
+        rollups.record(
+            rollups.line_delta(
+                sale, products[product_id], quantity,
+                products[product_id].selling_price * quantity,
+                (products[product_id].selling_price - products[product_id].purchase_price) * quantity,
+            )
+            for product_id, quantity in lines
+        )
+
+        metrics.sales_created.inc_on_commit()
+        metrics.items_sold.inc_on_commit(sum(quantities.values()))
+
+    return sale
+
+
+def request_fingerprint(lines):
+    """Stable hash of a sale's lines, used to spot a reused idempotency key."""
+    payload = json.dumps(lines, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def _replay(stored, fingerprint):
+    if stored.request_hash != fingerprint:
+        return SaleResult(422, {
+            'success': False,
+            'error': 'Idempotency-Key was already used for a different sale',
+        }, False)
+    return SaleResult(stored.status_code, stored.response, True)
+
+
+def _create_once(lines, key, fingerprint, is_paid):
+    try:
+        with transaction.atomic():
+            sale = create_sale(lines, is_paid=is_paid)
+            body = {
+                'success': True,
+                'sale_id': sale.id,
+                'total_amount': float(sale.total_amount),
+            }
+            if key:
+                # The unique key makes a concurrent duplicate roll back its sale
+                IdempotencyKey.objects.create(key=key, request_hash=fingerprint, sale=sale, response=body)
+    except IntegrityError:
+        stored = IdempotencyKey.objects.filter(key=key).first() if key else None
+        if stored is None:
+            raise
+        return _replay(stored, fingerprint)
+    except ValidationError as e:
+        return SaleResult(400, {'success': False, 'error': ' '.join(e.messages)}, False)
+    return SaleResult(200, body, False)
+
+
+@timed('sale.create_once')
+def create_sale_once(lines, key='', is_paid=True):
+    """
+    Create a sale from POS ``lines`` unless ``key`` already produced one, in
+    which case the stored response is returned without touching stock.
+    Successful sales are stored under ``key``; rejected ones are not, so a
+    retry is evaluated again. Returns a ``SaleResult``.
+    """
+    fingerprint = request_fingerprint(lines)
+    if key:
+        stored = IdempotencyKey.objects.filter(key=key).first()
+        if stored is not None:
+            return _replay(stored, fingerprint)
+    return _create_once(lines, key, fingerprint, is_paid)
+
+
+@timed('sale.create_bulk')
+def create_sales_bulk(entries, is_paid=True):
+    """
+    Create many POS sales, given as ``(key, lines)`` pairs, and return one
+    ``SaleResult`` per entry in order.
+
+    Entries are committed in transactions of ``SALE_BATCH_SIZE`` sales. Each
+    sale runs in its own savepoint, so a rejected sale does not affect its
+    neighbours, and the keys of a batch are looked up with one query. If the
+    request fails half way, the client resends everything and the sales of
+    committed batches are replayed by key.
+    """
+    results = []
+    for start in range(0, len(entries), SALE_BATCH_SIZE):
+        batch = entries[start:start + SALE_BATCH_SIZE]
+        with transaction.atomic():
+            stored = IdempotencyKey.objects.in_bulk([key for key, _ in batch if key], field_name='key')
+            for key, lines in batch:
+                fingerprint = request_fingerprint(lines)
+                if key in stored:
+                    results.append(_replay(stored[key], fingerprint))
+                else:
+                    # Repeats of a key within the batch are replayed via the unique index
+                    results.append(_create_once(lines, key, fingerprint, is_paid))
+    return results
+
+
+def restore_stock_for_items(items, notes=''):
+    """
+    Put the quantities of the SaleItem queryset ``items`` back into stock:
+    one grouped query, one set-based UPDATE per chunk of products and one
+    bulk insert of ADJUSTMENT ledger rows. Returns the ``StockChange`` map.
+    """
+    quantities = {
+        row['product_id']: row['total']
+        for row in items.order_by().values('product_id').annotate(total=Sum('quantity'))
+        if row['total']
+    }
+    if not quantities:
+        return {}
+    changes = stock.apply_stock_changes(quantities)
+    stock.record_stock_transactions(changes.values(), transaction_type='ADJUSTMENT', notes=notes)
+    return changes
+
+
+def _resum_totals(sale_ids):
+    """Recompute total_amount and profit of ``sale_ids`` with one UPDATE."""
+    money = models.DecimalField(max_digits=10, decimal_places=2)
+    lines = SaleItem.objects.filter(sale=OuterRef('pk')).order_by().values('sale')
+    Sale.objects.filter(pk__in=sale_ids).update(
+        total_amount=Coalesce(Subquery(
+            lines.annotate(total=Sum(F('price_at_sale') * F('quantity'), output_field=money)).values('total'),
+            output_field=money,
+        ), Decimal('0.00')),
+        profit=Coalesce(Subquery(
+            lines.annotate(total=Sum(
+                (F('price_at_sale') - Coalesce('purchase_price_at_sale', 'product__purchase_price'))
+                * F('quantity'),
+                output_field=money,
+            )).values('total'),
+            output_field=money,
+        ), Decimal('0.00')),
+    )
+
+
+@timed('sale.delete_bulk')
+def delete_sales(queryset):
+    """
+    Delete the sales in ``queryset`` and restore the stock of their items.
+    The query count depends on the number of distinct products, not items.
+    """
+    with transaction.atomic():
+        items = SaleItem.objects.filter(sale__in=queryset)
+        rollups.record(rollups.deltas_for_items(items, sign=-1))
+        restore_stock_for_items(items, notes='Restored from bulk sale deletion')
+        # The sales go too, so the per-item empty sale check has nothing to do
+        with deferred_empty_sale_cleanup():
+            queryset.delete()
+
+
+@timed('sale.delete_items')
+def delete_sale_items(queryset):
+    """
+    Delete the SaleItem ``queryset``, restore its stock, fix the totals of the
+    affected sales and delete the sales left without items.
+    """
+    with transaction.atomic():
+        sale_ids = list(queryset.order_by().values_list('sale_id', flat=True).distinct())
+        rollups.record(rollups.deltas_for_items(queryset, sign=-1))
+        restore_stock_for_items(queryset, notes='Restored from bulk sale item deletion')
+        with deferred_empty_sale_cleanup():
+            queryset.delete()
+        _resum_totals(sale_ids)
+        empty = Sale.objects.filter(pk__in=sale_ids, items__isnull=True)
+        Sale.objects.filter(pk__in=empty.values('pk')).delete()
@@ -0,0 +1,137 @@
+"""
+Opt-in slow query log.
+
+With ``SLOW_QUERY_LOG_ENABLED`` every database connection gets an execute
+wrapper that times its queries. A query taking ``SLOW_QUERY_THRESHOLD_MS`` or
+longer is written as one JSON line to the ``inventory.slow_queries`` logger,
+which settings route to the rotating ``SLOW_QUERY_LOG_FILE``. The line holds
+the SQL and parameters, the URL name of the view (or admin page) being
+served, the first application frame that issued the query and, for reads,
+the backend's ``EXPLAIN`` of the same statement.
+
+``fingerprint`` normalizes the SQL so the ``slow_queries`` command can group
+the log by statement shape.
+"""
+
+import hashlib
+import json
+import logging
+import re
+import time
+import traceback
+from contextlib import nullcontext
+from contextvars import ContextVar
+from pathlib import Path
+
+from django.conf import settings
+from django.db import DatabaseError, transaction
+from django.utils import timezone
+
+slow_query_logger = logging.getLogger('inventory.slow_queries')
+
+# URL name of the view being served, set by SlowQueryMiddleware
+current_view = ContextVar('slow_query_view', default='')
+# Set while the wrapper runs its own EXPLAIN
+_explaining = ContextVar('slow_query_explaining', default=False)
+
+MAX_PARAMS_LENGTH = 2000
+
+_IN_LIST = re.compile(r'\(\s*(?:%s|\?)(?:\s*,\s*(?:%s|\?))*\s*\)')
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_SPACE = re.compile(r'\s+')
+
+
+def normalize(sql):
+    """``sql`` with literals replaced by ``?`` and IN lists collapsed."""
+    sql = _STRING.sub('?', sql)
+    sql = _NUMBER.sub('?', sql)
+    sql = sql.replace('%s', '?')
+    sql = _IN_LIST.sub('(...)', sql)
+    return _SPACE.sub(' ', sql).strip()
+
+
+def fingerprint(sql):
+    return hashlib.md5(normalize(sql).encode()).hexdigest()[:12]
+
+
+def _caller():
+    """``path:line in function`` of the innermost frame outside Django and this module."""
+    for frame in reversed(traceback.extract_stack()[:-3]):
+        filename = frame.filename.replace('\\', '/')
+        if '/django/' in filename or '/site-packages/' in filename or filename.endswith('slowqueries.py'):
+            continue
+        return f'{frame.filename}:{frame.lineno} in {frame.name}'
+    return ''
+
+
+def _explain(connection, sql, params):
+    if not sql.lstrip().upper().startswith(('SELECT', 'WITH')):
+        return None
+    token = _explaining.set(True)
+    try:
+        # A failed EXPLAIN must not abort the caller's transaction
+        savepoint = transaction.atomic(using=connection.alias) if connection.in_atomic_block else nullcontext()
+        with savepoint:
+            with connection.cursor() as cursor:
+                cursor.execute(f'{connection.ops.explain_query_prefix()} {sql}', params)
+                rows = cursor.fetchall()
+    except DatabaseError as e:
+        return f'EXPLAIN failed: {e}'
+    finally:
+        _explaining.reset(token)
+    return '\n'.join(' '.join(str(value) for value in row) for row in rows)
+
+
+def slow_query_wrapper(execute, sql, params, many, context):
+    """``execute_wrapper`` logging queries slower than ``SLOW_QUERY_THRESHOLD_MS``."""
+    if _explaining.get():
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    result = execute(sql, params, many, context)
+    elapsed = (time.perf_counter() - start) * 1000
+    if elapsed >= settings.SLOW_QUERY_THRESHOLD_MS:
+        connection = context['connection']
+        slow_query_logger.warning('%s', json.dumps({
+            'time': timezone.now().isoformat(),
+            'ms': round(elapsed, 2),
+            'database': connection.alias,
+            'view': current_view.get(),
+            'caller': _caller(),
+            'fingerprint': fingerprint(sql),
+            'sql': sql,
+            'params': repr(params)[:MAX_PARAMS_LENGTH],
+            'many': many,
+            'plan': None if many else _explain(connection, sql, params),
+        }))
+    return result
+
+
+def install(sender, connection, **kwargs):
+    """``connection_created`` receiver adding the wrapper once per connection object.
+
+    The connection may be opened inside a temporary ``execute_wrapper`` block
+    (``QueryStatsMiddleware``'s, with ``CONN_MAX_AGE=0``), whose exit pops the
+    last wrapper, so this one goes first in the list instead.
+    """
+    if settings.SLOW_QUERY_LOG_ENABLED and slow_query_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, slow_query_wrapper)
+
+
+def read_log(path):
+    """Entries of the slow query log at ``path`` and its rotated backups, oldest first."""
+    path = Path(path)
+    # RotatingFileHandler backups: .1 is the newest
+    backups = [p for p in path.parent.glob(path.name + '.*') if p.suffix[1:].isdigit()]
+    backups.sort(key=lambda p: int(p.suffix[1:]), reverse=True)
+    entries = []
+    for log_file in backups + [path]:
+        if not log_file.exists():
+            continue
+        with open(log_file, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entries.append(json.loads(line))
+                except ValueError:
+                    continue
+    return entries
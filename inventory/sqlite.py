@@ -0,0 +1,56 @@
+"""
+Connection setup for the opt-in SQLite production profile.
+
+With ``SQLITE_PROFILE=production`` every new SQLite connection runs the
+``SQLITE_PRAGMAS`` from settings: WAL journaling, so chart reads no longer
+block POS writes; ``synchronous=NORMAL``, which is safe under WAL; a
+``busy_timeout``, so a writer waits for the lock instead of failing with
+"database is locked"; plus memory-mapped I/O, a larger page cache and
+in-memory temporary tables.
+
+``SQLITE_TRANSACTION_MODE=IMMEDIATE`` makes ``transaction.atomic`` take the
+write lock when it begins. A deferred transaction that reads before it writes
+cannot wait for the lock once another writer got in first, and SQLite fails
+it at once regardless of ``busy_timeout``. On Django 5.1 and later the
+settings pass the mode as the ``transaction_mode`` database option; older
+versions have no such option, so the connection's private hook that begins
+transactions is replaced here instead.
+"""
+
+from types import MethodType
+
+import django
+from django.conf import settings
+
+# First Django version with the transaction_mode option of the SQLite backend
+TRANSACTION_MODE_OPTION = (5, 1)
+
+
+def _begin(mode):
+    def start_transaction_under_autocommit(self):
+        self.cursor().execute(f'BEGIN {mode}')
+    return start_transaction_under_autocommit
+
+
+def configure_connection(sender, connection, **kwargs):
+    """``connection_created`` receiver applying the SQLite profile."""
+    if connection.vendor != 'sqlite':
+        return
+    pragmas = getattr(settings, 'SQLITE_PRAGMAS', {})
+    if pragmas:
+        with connection.cursor() as cursor:
+            for name, value in pragmas.items():
+                cursor.execute(f'PRAGMA {name} = {value}')
+    mode = getattr(settings, 'SQLITE_TRANSACTION_MODE', '')
+    if mode and django.VERSION < TRANSACTION_MODE_OPTION:
+        connection._start_transaction_under_autocommit = MethodType(_begin(mode), connection)
+
+
+def current_pragmas(connection):
+    """The effective values of the profile's pragmas on ``connection``."""
+    values = {}
+    with connection.cursor() as cursor:
+        for name in ('journal_mode', 'synchronous', 'busy_timeout', 'mmap_size', 'cache_size', 'temp_store'):
+            cursor.execute(f'PRAGMA {name}')
+            values[name] = cursor.fetchone()[0]
+    return values
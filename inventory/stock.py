@@ -0,0 +1,296 @@
+"""
+Stock mutation engine.
+
+Stock levels are changed with conditional ``UPDATE`` statements of the form
+``SET stock_quantity = stock_quantity + n WHERE ...`` so two terminals selling
+the same product can never overwrite each other's changes. The max/min level
+guards live in the ``WHERE`` clause and the new values come back through
+``RETURNING``, so callers get the before/after stock without re-reading rows.
+
+On backends with row locks (PostgreSQL) each chunk of products is locked with
+``SELECT ... FOR UPDATE`` in primary key order before it is updated, so two
+sales touching the same products always queue on them in the same order
+instead of deadlocking.
+"""
+
+from collections import namedtuple
+
+from django.core.exceptions import ValidationError
+from django.db import connections, router, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import caching, metrics
+from .instrumentation import timed
+
+# Products per UPDATE statement; keeps the parameter count well under
+# SQLite's historical limit of 999 bound variables.
+CHUNK_SIZE = 100
+
+# Attempts for the compare-and-swap used when clamping a decrease at zero.
+CLAMP_RETRIES = 5
+
+
+class StockChange(namedtuple('StockChange', [
+    'product_id', 'previous_stock', 'new_stock', 'min_stock_level', 'low_stock_alert',
+])):
+    """The outcome of a stock mutation for a single product."""
+    __slots__ = ()
+
+    @property
+    def quantity_change(self):
+        return self.new_stock - self.previous_stock
+
+    @property
+    def needs_low_stock_alert(self):
+        return bool(self.low_stock_alert) and self.new_stock <= self.min_stock_level
+
+
+def _product_model():
+    from .models import Product
+    return Product
+
+
+def _supports_update_returning(connection):
+    if connection.vendor == 'postgresql':
+        return True
+    if connection.vendor == 'sqlite':
+        return connection.Database.sqlite_version_info >= (3, 35, 0)
+    return False
+
+
+def _columns(connection):
+    opts = _product_model()._meta
+    qn = connection.ops.quote_name
+    return {
+        'table': qn(opts.db_table),
+        'pk': qn(opts.pk.column),
+        'stock': qn(opts.get_field('stock_quantity').column),
+        'min': qn(opts.get_field('min_stock_level').column),
+        'max': qn(opts.get_field('max_stock_level').column),
+        'alert': qn(opts.get_field('low_stock_alert').column),
+        'updated_at': qn(opts.get_field('updated_at').column),
+    }
+
+
+def _guarded_update(connection, changes, increase, now):
+    """
+    Apply ``changes`` ({product_id: delta}, all of the same sign) with one
+    statement and return {product_id: StockChange} for the rows whose guard
+    held. Rows that would exceed ``max_stock_level`` (increases) or drop below
+    zero (decreases) are left untouched and missing from the result.
+    """
+    cols = _columns(connection)
+    ids = list(changes)
+    case_sql = 'CASE %s %s END' % (cols['pk'], ' '.join(['WHEN %s THEN %s'] * len(ids)))
+    case_params = [value for pk in ids for value in (pk, changes[pk])]
+    if increase:
+        guard_sql = '%s + (%s) <= %s' % (cols['stock'], case_sql, cols['max'])
+    else:
+        guard_sql = '%s + (%s) >= 0' % (cols['stock'], case_sql)
+
+    sql = (
+        'UPDATE {table} SET {stock} = {stock} + ({case}), {updated_at} = %s '
+        'WHERE {pk} IN ({ids}) AND {guard} '
+        'RETURNING {pk}, {stock}, {min}, {alert}'
+    ).format(case=case_sql, ids=', '.join(['%s'] * len(ids)), guard=guard_sql, **cols)
+    params = case_params + [connection.ops.adapt_datetimefield_value(now)] + ids + case_params
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+
+    return {
+        pk: StockChange(pk, stock - changes[pk], stock, min_level, alert)
+        for pk, stock, min_level, alert in rows
+    }
+
+
+def _lock_rows(using, ids):
+    """Lock the product rows ``ids`` in primary key order until the transaction ends."""
+    Product = _product_model()
+    locked = Product.objects.using(using).select_for_update().filter(pk__in=ids).order_by('pk')
+    list(locked.values_list('pk', flat=True))
+
+
+def _locked_update(connection, changes, increase, now):
+    """
+    Fallback for backends without ``UPDATE ... RETURNING``: lock the rows,
+    then apply the same guarded update row by row.
+    """
+    Product = _product_model()
+    rows = (
+        Product.objects.using(connection.alias)
+        .select_for_update()
+        .filter(pk__in=list(changes))
+        .order_by('pk')
+        .values_list('pk', 'stock_quantity', 'min_stock_level', 'max_stock_level', 'low_stock_alert')
+    )
+    results = {}
+    for pk, stock, min_level, max_level, alert in rows:
+        new_stock = stock + changes[pk]
+        if (increase and new_stock > max_level) or (not increase and new_stock < 0):
+            continue
+        Product.objects.using(connection.alias).filter(pk=pk).update(
+            stock_quantity=new_stock, updated_at=now
+        )
+        results[pk] = StockChange(pk, stock, new_stock, min_level, alert)
+    return results
+
+
+def _clamp_to_zero(using, pk, now):
+    """Drain a product's stock to zero, returning the StockChange applied."""
+    Product = _product_model()
+    products = Product.objects.using(using)
+    # With a row lock the compare-and-swap below succeeds on the first try
+    reads = products.select_for_update() if connections[using].features.has_select_for_update else products
+    for _ in range(CLAMP_RETRIES):
+        row = reads.filter(pk=pk).values_list(
+            'stock_quantity', 'min_stock_level', 'low_stock_alert'
+        ).first()
+        if row is None:
+            raise Product.DoesNotExist(f'Product {pk} does not exist.')
+        stock, min_level, alert = row
+        if products.filter(pk=pk, stock_quantity=stock).update(stock_quantity=0, updated_at=now):
+            return StockChange(pk, stock, 0, min_level, alert)
+    raise ValidationError(f'Stock for product {pk} is changing too quickly, please retry.')
+
+
+def _raise_for_rejected(using, changes, rejected):
+    Product = _product_model()
+    products = Product.objects.using(using).in_bulk(rejected)
+    for pk in rejected:
+        product = products.get(pk)
+        if product is None:
+            raise Product.DoesNotExist(f'Product {pk} does not exist.')
+        if changes[pk] > 0:
+            raise ValidationError(
+                f'Cannot exceed maximum stock level of {product.max_stock_level} for {product.name}'
+            )
+        raise ValidationError(
+            f'Not enough stock for {product.name}. Only {product.stock_quantity} units available.'
+        )
+
+
+@timed('stock.apply_changes')
+def apply_stock_changes(changes, clamp=False, using=None):
+    """
+    Apply several stock changes at once.
+
+    ``changes`` maps product ids to signed quantity changes. Every product row
+    is written exactly once, with one statement per sign and chunk of
+    products. Increases may not push stock past ``max_stock_level`` and
+    decreases may not push it below zero; with ``clamp=True`` decreases that
+    would go negative drain the stock to zero instead of failing.
+
+    All changes are applied or none are: a failed guard raises
+    ``ValidationError`` and an unknown id raises ``Product.DoesNotExist``.
+    Returns a dict of ``StockChange`` keyed by product id.
+    """
+    changes = {pk: delta for pk, delta in changes.items() if delta}
+    if not changes:
+        return {}
+
+    using = using or router.db_for_write(_product_model())
+    connection = connections[using]
+    update = _guarded_update if _supports_update_returning(connection) else _locked_update
+    lock_rows = connection.features.has_select_for_update
+    now = timezone.now()
+
+    results = {}
+    with transaction.atomic(using=using):
+        ordered = sorted(changes)
+        for start in range(0, len(ordered), CHUNK_SIZE):
+            chunk = ordered[start:start + CHUNK_SIZE]
+            if lock_rows and len(chunk) > 1:
+                _lock_rows(using, chunk)
+            for increase in (True, False):
+                subset = {pk: changes[pk] for pk in chunk if (changes[pk] > 0) == increase}
+                if subset:
+                    results.update(update(connection, subset, increase, now))
+
+        rejected = [pk for pk in ordered if pk not in results]
+        if clamp:
+            clamped = [pk for pk in rejected if changes[pk] < 0]
+            for pk in clamped:
+                results[pk] = _clamp_to_zero(using, pk, now)
+            rejected = [pk for pk in rejected if pk not in results]
+        if rejected:
+            _raise_for_rejected(using, changes, rejected)
+
+        # Raw UPDATEs send no signals, so invalidate cached charts here
+        caching.bump_data_version()
+
+    return results
+
+
+def apply_stock_change(product_id, quantity_change, clamp=False, using=None):
+    """Apply a single stock change and return its ``StockChange``."""
+    if not quantity_change:
+        raise ValueError('quantity_change must be non-zero.')
+    return apply_stock_changes({product_id: quantity_change}, clamp=clamp, using=using)[product_id]
+
+
+@timed('stock.restock_to_max')
+def restock_to_max(products, transaction_type='PURCHASE', notes='', created_by=None):
+    """
+    Raise every product of the ``products`` queryset to its
+    ``max_stock_level`` with a single ``UPDATE ... SET stock_quantity =
+    max_stock_level`` and write the ledger rows in one bulk insert.
+
+    The rows are locked and snapshotted first, so the ledger's before/after
+    values match what the UPDATE did. Products already at or above their
+    maximum are left alone. Returns ``(restocked, skipped)`` counts.
+    """
+    Product = _product_model()
+    using = router.db_for_write(Product)
+    selected = Product.objects.using(using).filter(pk__in=products.order_by().values('pk'))
+    now = timezone.now()
+
+    with transaction.atomic(using=using):
+        snapshot = list(
+            selected.select_for_update().order_by('pk')
+            .values_list('pk', 'stock_quantity', 'max_stock_level', 'min_stock_level', 'low_stock_alert')
+        )
+        changes = [
+            StockChange(pk, stock, max_level, min_level, alert)
+            for pk, stock, max_level, min_level, alert in snapshot
+            if stock < max_level
+        ]
+        if changes:
+            # Same predicate as the snapshot, whose rows are locked
+            selected.filter(stock_quantity__lt=F('max_stock_level')).update(
+                stock_quantity=F('max_stock_level'),
+                updated_at=now,
+            )
+            record_stock_transactions(changes, transaction_type, notes=notes, created_by=created_by, using=using)
+            caching.bump_data_version()
+
+    return len(changes), len(snapshot) - len(changes)
+
+
+def record_stock_transactions(stock_changes, transaction_type, notes='', created_by=None, using=None):
+    """
+    Write one ``StockTransaction`` per applied change with a single
+    ``bulk_create``. Changes that ended up moving no stock are skipped.
+    """
+    from .models import StockTransaction
+
+    entries = [
+        StockTransaction(
+            product_id=change.product_id,
+            quantity=abs(change.quantity_change),
+            is_increase=change.quantity_change > 0,
+            transaction_type=transaction_type,
+            notes=notes,
+            previous_stock=change.previous_stock,
+            new_stock=change.new_stock,
+            created_by=created_by,
+        )
+        for change in stock_changes
+        if change.quantity_change
+    ]
+    if not entries:
+        return []
+    metrics.stock_transactions.inc_on_commit(len(entries), transaction_type=transaction_type)
+    return StockTransaction.objects.using(using or router.db_for_write(StockTransaction)).bulk_create(entries)
@@ -0,0 +1,590 @@
+import json
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
+
+import django
+from django.contrib import admin
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS, connection, connections, transaction
+from django.db.models import Sum
+from django.http import QueryDict
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.http import urlencode
+
+from inventory import caching, catalog, charts, history, metrics, rollups, services
+from inventory.pagination import EstimatedCountPaginator
+from inventory.models import (
+    Category, Customer, DailyCategorySales, DailyProductSales, Product, Sale, SaleItem, SaleReturn, StockAlert,
+    StockTransaction,
+)
+
+_test_settings = None
+
+
+def setUpModule():
+    # Keep the metric files and endpoint stats the tests write out of the project's cache/
+    global _test_settings
+    directory = tempfile.mkdtemp()
+    _test_settings = override_settings(
+        METRICS_DIR=f'{directory}/metrics', ENDPOINT_STATS_DIR=f'{directory}/endpoint-stats')
+    _test_settings.enable()
+    _test_settings.directory = directory
+
+
+def tearDownModule():
+    metrics.reset()
+    _test_settings.disable()
+    shutil.rmtree(_test_settings.directory, ignore_errors=True)
+
+
+def inventory_changelists():
+    """(URL, ModelAdmin) of every changelist of the inventory app."""
+    return [
+        (reverse(f'admin:inventory_{model._meta.model_name}_changelist'), model_admin)
+        for model, model_admin in admin.site._registry.items()
+        if model._meta.app_label == 'inventory'
+    ]
+
+
+def full_scans(plan, vendor):
+    """
+    Names of the tables an EXPLAIN output reads without an index lookup,
+    counting a walk over a whole index as a full scan.
+    """
+    if vendor == 'postgresql':
+        # One chunk per plan node; an index scan without an Index Cond (or a
+        # bitmap scan without a Recheck Cond) reads the whole index
+        scans = []
+        for node in re.split(r'\n(?=\s*->)', plan):
+            match = re.search(
+                r'(Seq Scan|(?<!Bitmap )Index (?:Only )?Scan(?: Backward)?(?: using \w+)?|Bitmap Heap Scan) on (\w+)',
+                node.split('\n')[0],
+            )
+            if match and ('Seq Scan' in match.group(1) or not re.search(r'(?:Index|Recheck) Cond:', node)):
+                scans.append(match.group(2))
+        return scans
+    # SQLite: only "SEARCH <table> USING ..." is a lookup; "SCAN <table>" reads
+    # every row, through an index or not. Scans of its own co-routines
+    # (subqueries in FROM) are not table reads.
+    coroutines = set(re.findall(r'(?:CO-ROUTINE|MATERIALIZE) (\w+)', plan))
+    return [table for table in re.findall(r'\bSCAN (\w+)', plan) if table not in coroutines]
+
+
+class ChangelistQueryCountTests(TestCase):
+    """Every inventory changelist runs the same number of queries however many rows it shows."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+
+    def setUp(self):
+        self.client.force_login(self.user)
+        self.rows = 0
+
+    def add_rows(self, count):
+        """Add ``count`` rows to every inventory changelist, each with its own related objects."""
+        for _ in range(count):
+            self.rows += 1
+            category = Category.objects.create(name=f'Category {self.rows}')
+            product = Product.objects.create(
+                name=f'Product {self.rows}', category=category, purchase_price=Decimal('1.00'),
+                selling_price=Decimal('2.00'), stock_quantity=50, low_stock_alert=False,
+            )
+            # A price change writes a ProductPriceHistory row
+            product.selling_price = Decimal('3.00')
+            product.save()
+            customer = Customer.objects.create(name=f'Customer {self.rows}', contact_info='555-0100')
+            sale = services.create_sale([{'product_id': product.pk, 'quantity': 2}], customer=customer)
+            SaleReturn.objects.create(sale_item=sale.items.get(), quantity=1, reason='Damaged')
+            StockAlert.objects.create(product=product, stock_quantity=1, min_stock_level=5)
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_query_count_does_not_grow_with_rows(self):
+        self.add_rows(2)
+        expected = {url: self.count_queries(url) for url, _ in inventory_changelists()}
+        self.add_rows(8)
+        for url, count in expected.items():
+            with self.subTest(url=url), self.assertNumQueries(count):
+                self.client.get(url)
+
+    def test_query_count_does_not_depend_on_page_size(self):
+        self.add_rows(6)
+        for url, model_admin in inventory_changelists():
+            with self.subTest(url=url):
+                with mock.patch.object(model_admin, 'list_per_page', 2):
+                    count = self.count_queries(url)
+                with mock.patch.object(model_admin, 'list_per_page', 100), self.assertNumQueries(count):
+                    self.client.get(url)
+
+
+class QueryPlanTests(TestCase):
+    """
+    EXPLAIN every query the dashboard charts, the stock history API and the
+    admin changelists run, and fail if one reads a whole table.
+    """
+
+    # Lookup tables small enough to read in full: categories, and the
+    # permissions (with their content types) Django loads for a superuser
+    SMALL_TABLES = {Category._meta.db_table, 'auth_permission', 'django_content_type'}
+
+    # Changelists that read whole tables by design, by model. An unfiltered
+    # changelist also reads its own table: it has no condition to look up,
+    # so the page walks the ordering index (stopping after list_per_page
+    # rows) and the paginator counts every row, or with
+    # EstimatedCountPaginator up to COUNT_THRESHOLD ids.
+    KNOWN_FULL_SCANS = {
+        # Sale items are ordered by their sale's date, which no index of the
+        # item table holds: an unfiltered page walks the sale date index
+        # (PostgreSQL) or sorts every item (SQLite). Filtering by date, as
+        # checked below, turns either into index lookups.
+        'saleitem': {Sale._meta.db_table},
+        # The customer filter lists every customer, and show_full_result_count
+        # counts every sale next to a filtered result
+        'sale': {Customer._meta.db_table, Sale._meta.db_table},
+        # The product filter lists every product
+        'productpricehistory': {Product._meta.db_table},
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        cls.category = Category.objects.create(name='Drinks')
+        # Two rows everywhere, so a changelist of one row per page is paginated
+        for name, customer_name in (('Cola', 'Alice'), ('Cocoa', 'Bob')):
+            product = Product.objects.create(
+                name=name, category=cls.category, purchase_price=Decimal('1.00'),
+                selling_price=Decimal('2.00'), stock_quantity=50, low_stock_alert=False,
+            )
+            product.selling_price = Decimal('2.50')
+            product.save()
+            customer = Customer.objects.create(name=customer_name, contact_info='555-0100')
+            sale = services.create_sale([{'product_id': product.pk, 'quantity': 2}], customer=customer)
+            SaleReturn.objects.create(sale_item=sale.items.get(), quantity=1, reason='Damaged')
+            StockAlert.objects.create(product=product, stock_quantity=1, min_stock_level=5)
+        cls.product = Product.objects.get(name='Cola')
+
+    def assertUsesIndexes(self, run, allowed=()):
+        """Fail if a SELECT run by ``run`` reads a table outside ``allowed`` and SMALL_TABLES in full."""
+        with CaptureQueriesContext(connection) as queries:
+            run()
+        selects = [query['sql'] for query in queries.captured_queries if query['sql'].startswith('SELECT')]
+        self.assertTrue(selects)
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                # Tiny test tables are cheaper to scan, or to hash or merge in
+                # full; ask whether index lookups can answer the query at all
+                cursor.execute('SET LOCAL enable_seqscan = off')
+                cursor.execute('SET LOCAL enable_hashjoin = off')
+                cursor.execute('SET LOCAL enable_mergejoin = off')
+            for sql in selects:
+                cursor.execute(f'{connection.ops.explain_query_prefix()} {sql}')
+                plan = '\n'.join(' '.join(str(value) for value in row) for row in cursor.fetchall())
+                scans = set(full_scans(plan, connection.vendor)) - self.SMALL_TABLES - set(allowed)
+                self.assertFalse(scans, f'Full scan of {", ".join(sorted(scans))}:\n{sql}\n{plan}')
+
+    def test_dashboard_charts(self):
+        # The stock level chart lists every active product
+        products = {Product._meta.db_table}
+        self.assertUsesIndexes(lambda: charts.dashboard_data(QueryDict()), allowed=products)
+        self.assertUsesIndexes(lambda: charts.stock_levels(search='co'), allowed=products)
+        self.assertUsesIndexes(lambda: charts.top_selling(days=90, category_id=self.category.pk, search='co'))
+
+    def test_stock_history(self):
+        self.assertUsesIndexes(lambda: history.stock_history(self.product.pk))
+        page = history.stock_history(self.product.pk, limit=1)
+        self.assertUsesIndexes(lambda: history.stock_history(
+            self.product.pk, cursor=page['next_cursor'], limit=1, transaction_type='SALE'))
+
+    def test_admin_changelists(self):
+        self.client.force_login(self.user)
+        week_ago = (timezone.now() - timedelta(days=7)).isoformat()
+        changelists = dict(inventory_changelists())
+        checks = []
+        for url, model_admin in changelists.items():
+            opts = model_admin.model._meta
+            checks.append((url, model_admin, {opts.db_table} | self.KNOWN_FULL_SCANS.get(opts.model_name, set())))
+        for url, query, allowed in [
+            (reverse('admin:inventory_stocktransaction_changelist'), {'product__id__exact': self.product.pk}, set()),
+            (reverse('admin:inventory_sale_changelist'), {'date__gte': week_ago}, self.KNOWN_FULL_SCANS['sale']),
+            # Without ANALYZE statistics SQLite drives this page from the item
+            # table rather than the sale date index, which PostgreSQL uses
+            (reverse('admin:inventory_saleitem_changelist'), {'sale__date__gte': week_ago},
+             {SaleItem._meta.db_table} if connection.vendor == 'sqlite' else set()),
+        ]:
+            checks.append((f'{url}?{urlencode(query)}', changelists[url], allowed))
+
+        for url, model_admin, allowed in checks:
+            # One row per page, so the page is a LIMITed query as on a real table
+            with self.subTest(url=url), mock.patch.object(model_admin, 'list_per_page', 1):
+                self.assertUsesIndexes(lambda: self.assertEqual(self.client.get(url).status_code, 200), allowed)
+
+
+class RollupConsistencyTests(TestCase):
+    """The incrementally maintained rollups match rollups.rebuild() after every kind of change."""
+
+    def setUp(self):
+        category = Category.objects.create(name='Drinks')
+        self.customer = Customer.objects.create(name='Alice', contact_info='555-0100')
+        self.products = [
+            Product.objects.create(
+                name=f'Product {i}', category=category if i else None, purchase_price=Decimal('1.00'),
+                selling_price=Decimal('2.50'), stock_quantity=50, low_stock_alert=False,
+            )
+            for i in range(3)
+        ]
+        self.sales = []
+        for day in range(3):
+            sale = services.create_sale(
+                [{'product_id': product.pk, 'quantity': day + 1} for product in self.products],
+                customer=self.customer if day else None,
+            )
+            Sale.objects.filter(pk=sale.pk).update(date=timezone.now() - timedelta(days=day))
+            self.sales.append(Sale.objects.get(pk=sale.pk))
+        rollups.rebuild()
+        self.sale_return = SaleReturn.objects.create(
+            sale_item=self.sales[1].items.get(product=self.products[1]), quantity=1, reason='Damaged')
+        self.assertRollupsMatchRebuild()
+
+    def rollup_totals(self):
+        totals = {}
+        for model, key in ((DailyProductSales, 'product_id'), (DailyCategorySales, 'category_id')):
+            rows = model.objects.values('date', key).annotate(
+                total_units=Sum('units'), total_revenue=Sum('revenue'), total_cost=Sum('cost'))
+            for row in rows:
+                if row['total_units'] or row['total_revenue'] or row['total_cost']:
+                    totals[(model.__name__, row['date'], row[key])] = (
+                        row['total_units'], row['total_revenue'], row['total_cost'])
+        return totals
+
+    def assertRollupsMatchRebuild(self):
+        incremental = self.rollup_totals()
+        rollups.rebuild()
+        self.assertEqual(incremental, self.rollup_totals())
+
+    def test_change_sale_item(self):
+        item = self.sales[0].items.get(product=self.products[0])
+        item.quantity = 4
+        item.save()
+        item.product = self.products[2]
+        item.save()
+        self.assertRollupsMatchRebuild()
+
+    def test_delete_sale_item(self):
+        self.sales[1].items.get(product=self.products[1]).delete()
+        self.assertRollupsMatchRebuild()
+
+    def test_delete_sale(self):
+        self.sales[1].delete()
+        self.assertRollupsMatchRebuild()
+
+    def test_delete_return(self):
+        self.sale_return.delete()
+        self.assertRollupsMatchRebuild()
+
+    def test_bulk_delete_sales(self):
+        services.delete_sales(Sale.objects.filter(pk__in=[self.sales[0].pk, self.sales[1].pk]))
+        self.assertRollupsMatchRebuild()
+
+    def test_bulk_delete_sale_items(self):
+        services.delete_sale_items(SaleItem.objects.filter(product=self.products[1]))
+        self.assertRollupsMatchRebuild()
+
+    def test_delete_customer(self):
+        self.customer.delete()
+        self.assertRollupsMatchRebuild()
+
+    def test_delete_product(self):
+        self.products[1].delete()
+        self.assertRollupsMatchRebuild()
+
+
+class MetricsTests(TestCase):
+    def setUp(self):
+        metrics.reset()
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+        settings = override_settings(METRICS_DIR=self.directory)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.addCleanup(metrics.reset)
+
+    def dead_pid(self):
+        process = subprocess.Popen([sys.executable, '-c', ''])
+        process.wait()
+        return process.pid
+
+    def test_exited_process_is_folded_into_base(self):
+        path = metrics._metrics_dir() / f'{self.dead_pid()}-0000000000000000.db'
+        values = metrics._ValueFile(path)
+        values.add(metrics._key(metrics.sales_created.name, ()), 3)
+        values.add(metrics._key(metrics.stock_transactions.name, ('SALE',)), 5)
+        values.close()
+        metrics.sales_created.inc()
+
+        for _ in range(2):
+            text = metrics.render()
+            self.assertIn('inventory_sales_created_total 4\n', text)
+            self.assertIn('inventory_stock_transactions_total{transaction_type="SALE"} 5\n', text)
+            self.assertFalse(path.exists())
+            self.assertTrue((metrics._metrics_dir() / metrics.BASE_FILE).exists())
+
+
+class ChartInvalidationTests(TestCase):
+    def test_category_changes_bump_data_version(self):
+        category = Category.objects.create(name='Drinks')
+        with mock.patch.object(caching, 'bump_data_version') as bump:
+            category.name = 'Beverages'
+            category.save()
+            self.assertEqual(bump.call_count, 1)
+            category.delete()
+            self.assertEqual(bump.call_count, 2)
+
+    def test_category_changes_move_watermark(self):
+        category = Category.objects.create(name='Drinks')
+        Category.objects.create(name='Snacks')
+        before = caching.data_watermark()
+        category.name = 'Beverages'
+        category.save()
+        renamed = caching.data_watermark()
+        self.assertNotEqual(before, renamed)
+        Category.objects.filter(name='Snacks').delete()
+        self.assertNotEqual(renamed, caching.data_watermark())
+
+
+class StockTransactionAdminTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        cls.product = Product.objects.create(
+            name='Cola', purchase_price=Decimal('1.00'), selling_price=Decimal('2.00'),
+            stock_quantity=10, max_stock_level=20, low_stock_alert=False,
+        )
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def add(self, quantity, is_increase):
+        data = {'product': self.product.pk, 'transaction_type': 'ADJUSTMENT', 'quantity': quantity, 'notes': 'Count'}
+        if is_increase:
+            data['is_increase'] = 'on'
+        return self.client.post(reverse('admin:inventory_stocktransaction_add'), data)
+
+    def test_add_applies_stock_change_and_writes_ledger_row(self):
+        response = self.add(4, is_increase=True)
+        self.assertEqual(response.status_code, 302)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock_quantity, 14)
+        entry = StockTransaction.objects.get()
+        self.assertEqual((entry.previous_stock, entry.new_stock, entry.created_by), (10, 14, self.user))
+
+    def test_out_of_range_quantity_is_a_form_error(self):
+        for quantity, is_increase in ((11, False), (11, True)):
+            with self.subTest(quantity=quantity, is_increase=is_increase):
+                response = self.add(quantity, is_increase)
+                self.assertEqual(response.status_code, 200)
+                self.assertTrue(response.context['adminform'].form.errors['quantity'])
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock_quantity, 10)
+        self.assertFalse(StockTransaction.objects.exists())
+
+
+class CreateSaleQueryCountTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.products = [
+            Product.objects.create(
+                name=f'Product {i}', purchase_price=Decimal('1.00'), selling_price=Decimal('2.00'),
+                stock_quantity=50, min_stock_level=5, low_stock_alert=True,
+            )
+            for i in range(21)
+        ]
+
+    def sell(self, products, quantity):
+        return services.create_sale([{'product_id': product.pk, 'quantity': quantity} for product in products])
+
+    def test_query_count_does_not_depend_on_basket_size(self):
+        # The day's first sale also creates its rollup rows
+        self.sell(self.products[:1], 1)
+        # Every line drops its product below min_stock_level, so alerts are queued too
+        with CaptureQueriesContext(connection) as one_line:
+            self.sell(self.products[:1], 45)
+        # Where rows can be locked, baskets of several products lock theirs in
+        # order first (one query per chunk of stock.CHUNK_SIZE products)
+        expected = len(one_line) + (1 if connection.features.has_select_for_update else 0)
+        with self.assertNumQueries(expected):
+            self.sell(self.products[1:], 46)
+
+
+class BulkSaleUploadTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.product = Product.objects.create(
+            name='Cola', purchase_price=Decimal('1.00'), selling_price=Decimal('2.00'),
+            stock_quantity=50, low_stock_alert=False,
+        )
+
+    def upload(self, *sales):
+        response = self.client.post(
+            reverse('inventory:create_sales_bulk'), json.dumps({'sales': list(sales)}), content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        return response.json()['results']
+
+    def sale(self, key, quantity=1):
+        return {'idempotency_key': key, 'items': [{'product_id': self.product.pk, 'quantity': quantity}]}
+
+    def assertStock(self, expected):
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock_quantity, expected)
+
+    def test_resent_batch_is_replayed(self):
+        first = self.upload(self.sale('a'), self.sale('b', 2))
+        second = self.upload(self.sale('a'), self.sale('b', 2))
+        self.assertEqual([r['status'] for r in first + second], [200] * 4)
+        self.assertEqual([r['replayed'] for r in first + second], [False, False, True, True])
+        self.assertEqual([r['sale_id'] for r in first], [r['sale_id'] for r in second])
+        self.assertEqual(Sale.objects.count(), 2)
+        self.assertStock(47)
+
+    def test_key_reused_for_another_sale_is_rejected(self):
+        self.upload(self.sale('a'))
+        result, = self.upload(self.sale('a', 5))
+        self.assertEqual((result['status'], result['success']), (422, False))
+        self.assertEqual(Sale.objects.count(), 1)
+        self.assertStock(49)
+
+    def test_duplicate_keys_in_one_batch_create_one_sale(self):
+        first, repeat, other = self.upload(self.sale('a'), self.sale('a'), self.sale('a', 3))
+        self.assertEqual((first['status'], first['replayed']), (200, False))
+        self.assertEqual((repeat['status'], repeat['replayed'], repeat['sale_id']), (200, True, first['sale_id']))
+        self.assertEqual(other['status'], 422)
+        self.assertEqual(Sale.objects.count(), 1)
+        self.assertStock(49)
+
+    def test_malformed_sales_are_rejected_one_by_one(self):
+        results = self.upload(
+            self.sale('a'),
+            'not a sale',
+            {'idempotency_key': 'b'},
+            {'idempotency_key': 'c', 'items': 'cola'},
+            {'idempotency_key': 'd', 'items': [{'product_id': self.product.pk + 1000, 'quantity': 1}]},
+            self.sale('e', 51),
+            self.sale('f', 2),
+        )
+        self.assertEqual([r['status'] for r in results], [200, 400, 400, 400, 400, 400, 200])
+        self.assertStock(47)
+        # Rejected sales are not stored under their key, so a corrected retry goes through
+        result, = self.upload(self.sale('e', 3))
+        self.assertEqual((result['status'], result['replayed']), (200, False))
+
+    def test_refused_batch_has_no_results(self):
+        response = self.client.post(reverse('inventory:create_sales_bulk'), '{', content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertNotIn('results', response.json())
+
+
+@override_settings(ADMIN_COUNT_ESTIMATE_THRESHOLD=2, ADMIN_COUNT_LIMIT=4)
+class EstimatedCountPaginatorTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.product = Product.objects.create(
+            name='Cola', purchase_price=Decimal('1.00'), selling_price=Decimal('2.00'),
+            stock_quantity=50, low_stock_alert=False,
+        )
+        for _ in range(6):
+            services.create_sale([{'product_id': cls.product.pk, 'quantity': 1}])
+
+    def setUp(self):
+        caches['admin-counts'].clear()
+
+    def count(self, queryset):
+        return EstimatedCountPaginator(queryset, 2).count
+
+    def test_small_result_is_counted_exactly(self):
+        ids = SaleItem.objects.values_list('pk', flat=True)[:2]
+        self.assertEqual(self.count(SaleItem.objects.filter(pk__in=list(ids))), 2)
+
+    def test_filtered_count_stops_at_limit_and_is_cached(self):
+        if connection.vendor == 'postgresql':
+            self.skipTest('PostgreSQL uses the planner estimate')
+        items = SaleItem.objects.filter(product=self.product)
+        self.assertEqual(self.count(items), 4)
+        # Only the bounded read of the first ids runs again
+        with self.assertNumQueries(1):
+            self.assertEqual(self.count(items), 4)
+
+
+class SQLiteTransactionModeTests(SimpleTestCase):
+    databases = {'default'}
+
+    def setUp(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('SQLite only')
+
+    def test_atomic_begins_immediate(self):
+        original = connections[DEFAULT_DB_ALIAS]
+        settings_dict = dict(original.settings_dict)
+        if django.VERSION >= (5, 1):
+            settings_dict['OPTIONS'] = {**settings_dict['OPTIONS'], 'transaction_mode': 'IMMEDIATE'}
+        statements = []
+        fresh = type(original)(settings_dict, alias=DEFAULT_DB_ALIAS)
+        try:
+            with override_settings(SQLITE_TRANSACTION_MODE='IMMEDIATE'):
+                fresh.ensure_connection()
+            fresh.connection.set_trace_callback(statements.append)
+            connections[DEFAULT_DB_ALIAS] = fresh
+            with transaction.atomic():
+                Category.objects.exists()
+        finally:
+            connections[DEFAULT_DB_ALIAS] = original
+            fresh.close()
+        self.assertEqual(statements[0], 'BEGIN IMMEDIATE')
+
+
+class CatalogSyncTests(TestCase):
+    def make_product(self, barcode):
+        return Product.objects.create(
+            name=barcode, barcode=barcode, purchase_price=Decimal('1.00'),
+            selling_price=Decimal('2.00'), stock_quantity=10,
+        )
+
+    def test_delete_then_insert_reports_removal(self):
+        deleted = self.make_product('1001')
+        deleted_id = deleted.pk
+        version = catalog.snapshot()['version']
+        deleted.delete()
+        self.make_product('1002')
+
+        # Same count as before, so only the tombstone reveals the deletion
+        changes = catalog.changes_since(version)
+        self.assertFalse(changes['full'])
+        self.assertEqual(changes['count'], 1)
+        self.assertIn(deleted_id, changes['removed'])
+        self.assertEqual(list(changes['products']), ['1002'])
+        self.assertGreater(changes['version'], version)
+
+    def test_deletion_moves_version(self):
+        self.make_product('1001')
+        deleted = self.make_product('1002')
+        version = catalog.watermark()[0]
+        deleted.delete()
+        self.assertGreater(catalog.watermark()[0], version)
+
+    def test_expired_version_gets_snapshot(self):
+        self.make_product('1001')
+        old = timezone.now() - catalog.TOMBSTONE_RETENTION - timedelta(days=1)
+        self.assertTrue(catalog.changes_since(catalog.to_version(old))['full'])
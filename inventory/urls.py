@@ -10,10 +10,16 @@ urlpatterns = [
     path('chart/stock-status/', views.get_stock_status_chart, name='chart_stock_status'),
     path('chart/new-customers/', views.get_new_customers_chart, name='chart_new_customers'),
     path('chart/sales-by-category/', views.get_sales_by_category_chart, name='chart_sales_by_category'),
+    path('dashboard/data/', views.get_dashboard_data, name='dashboard_data'),
     path('api/product/<int:product_id>/price/', views.get_product_price, name='get_product_price'),
+    path('api/product/<int:product_id>/stock-history/', views.get_stock_history, name='stock_history'),
+    path('api/stats/endpoints/', views.get_endpoint_stats, name='endpoint_stats'),
+    path('metrics', views.get_metrics, name='metrics'),
     
     # POS URLs
     path('pos/', views.pos_view, name='pos'),
     path('api/product/barcode/<str:barcode>/', views.get_product_by_barcode, name='get_product_by_barcode'),
+    path('api/catalog/', views.get_catalog, name='get_catalog'),
     path('api/sale/create/', views.create_sale, name='create_sale'),
+    path('api/sale/bulk/', views.create_sales_bulk, name='create_sales_bulk'),
 ] 
\ No newline at end of file
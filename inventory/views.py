@@ -1,221 +1,114 @@
 # No views needed - using only the Django admin interface 
 
-from django.http import JsonResponse
+from django.http import HttpResponse, JsonResponse
+from django.conf import settings
+from django.utils.crypto import constant_time_compare
 from django.shortcuts import render
 from django.db.models import Count, Sum, F, Q
 from django.db import transaction
 from django.utils import timezone
-from datetime import timedelta
+from datetime import date, datetime, time, timedelta
 from .models import Product, Sale, Customer, Category, StockTransaction, SaleItem
-from django.views.decorators.cache import cache_page
-from django.views.decorators.http import require_GET, require_POST
+from . import catalog, charts, history, metrics, querystats, services
+from .caching import cached_chart, chart_etag
+from .routers import replica_view
+from django.views.decorators.cache import cache_control, cache_page
+from django.views.decorators.http import condition, require_GET, require_POST
 from django.views.decorators.csrf import csrf_exempt
+from django.contrib.admin.views.decorators import staff_member_required
 import json
 
+# Largest number of queued sales accepted by one bulk upload
+MAX_BULK_SALES = 500
+
+@replica_view
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=chart_etag('stock_levels'))
+@cached_chart('stock_levels')
 def get_stock_levels_chart(request):
     """Bar chart showing current stock levels vs min stock levels for all products"""
     search_query = request.GET.get('search', '').strip()
-    print(f"Search query received: {search_query}")  # Debug print
-    
-    products = Product.objects.filter(is_active=True)
-    
-    if search_query:
-        products = products.filter(name__icontains=search_query)
-        print(f"Filtered products count: {products.count()}")  # Debug print
-    
-    products = products.values(
-        'name', 'stock_quantity', 'min_stock_level'
-    ).order_by('name')
-
-    data = {
-        'labels': [p['name'] for p in products],
-        'datasets': [
-            {
-                'label': 'Current Stock',
-                'data': [p['stock_quantity'] for p in products],
-                'backgroundColor': 'rgba(54, 162, 235, 0.5)',
-                'borderColor': 'rgba(54, 162, 235, 1)',
-                'borderWidth': 1
-            },
-            {
-                'label': 'Minimum Stock Level',
-                'data': [p['min_stock_level'] for p in products],
-                'backgroundColor': 'rgba(255, 99, 132, 0.5)',
-                'borderColor': 'rgba(255, 99, 132, 1)',
-                'borderWidth': 1
-            }
-        ]
-    }
-    print(f"Returning {len(data['labels'])} products")  # Debug print
-    return JsonResponse(data)
+    return JsonResponse(charts.stock_levels(search_query))
 
+@replica_view
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=chart_etag('top_selling'))
+@cached_chart('top_selling')
 def get_top_selling_products(request):
     """Bar chart showing top 5 selling products by quantity"""
-    category_id = request.GET.get('category')
-    days = int(request.GET.get('days', 30))
-    search_query = request.GET.get('search', '').strip()
-    
-    start_date = timezone.now() - timedelta(days=days)
-    
-    # Start with SaleItem to avoid duplicate counting
-    query = SaleItem.objects.filter(
-        sale__date__gte=start_date,
-        product__is_active=True
-    )
-    
-    if category_id:
-        query = query.filter(product__category_id=category_id)
-    
-    if search_query:
-        query = query.filter(product__name__icontains=search_query)
-    
-    # Group by product name and sum quantities
-    top_products = query.values(
-        'product__name'
-    ).annotate(
-        total_quantity=Sum('quantity')
-    ).order_by('-total_quantity')[:5]
-
-    return JsonResponse({
-        'labels': [p['product__name'] for p in top_products],
-        'datasets': [{
-            'label': 'Units Sold',
-            'data': [p['total_quantity'] for p in top_products],
-            'backgroundColor': [
-                'rgba(255, 99, 132, 0.5)',
-                'rgba(54, 162, 235, 0.5)',
-                'rgba(255, 206, 86, 0.5)',
-                'rgba(75, 192, 192, 0.5)',
-                'rgba(153, 102, 255, 0.5)'
-            ],
-            'borderColor': [
-                'rgba(255, 99, 132, 1)',
-                'rgba(54, 162, 235, 1)',
-                'rgba(255, 206, 86, 1)',
-                'rgba(75, 192, 192, 1)',
-                'rgba(153, 102, 255, 1)'
-            ],
-            'borderWidth': 1
-        }]
-    })
+    return JsonResponse(charts.top_selling(
+        days=int(request.GET.get('days', 30)),
+        category_id=request.GET.get('category'),
+        search=request.GET.get('search', '').strip()
+    ))
 
+@replica_view
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=chart_etag('sales_profit'))
+@cached_chart('sales_profit')
 def get_sales_profit_chart(request):
     """Line chart showing sales and profit over time"""
-    days = int(request.GET.get('days', 30))
-    start_date = timezone.now() - timedelta(days=days)
-    
-    sales_data = Sale.objects.filter(
-        date__gte=start_date
-    ).values('date__date').annotate(
-        total_sales=Sum('total_amount'),
-        total_profit=Sum('profit')
-    ).order_by('date__date')
-
-    return JsonResponse({
-        'labels': [str(entry['date__date']) for entry in sales_data],
-        'datasets': [
-            {
-                'label': 'Sales',
-                'data': [float(entry['total_sales']) for entry in sales_data],
-                'borderColor': 'rgba(54, 162, 235, 1)',
-                'backgroundColor': 'rgba(54, 162, 235, 0.1)',
-                'fill': True
-            },
-            {
-                'label': 'Profit',
-                'data': [float(entry['total_profit']) for entry in sales_data],
-                'borderColor': 'rgba(75, 192, 192, 1)',
-                'backgroundColor': 'rgba(75, 192, 192, 0.1)',
-                'fill': True
-            }
-        ]
-    })
+    return JsonResponse(charts.sales_profit(days=int(request.GET.get('days', 30))))
 
+@replica_view
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=chart_etag('stock_status'))
+@cached_chart('stock_status')
 def get_stock_status_chart(request):
     """Pie chart showing stock status distribution"""
-    products = Product.objects.filter(is_active=True)
-    
-    out_of_stock = products.filter(stock_quantity=0).count()
-    low_stock = products.filter(
-        stock_quantity__gt=0,
-        stock_quantity__lte=F('min_stock_level')
-    ).count()
-    in_stock = products.filter(
-        stock_quantity__gt=F('min_stock_level')
-    ).count()
-
-    return JsonResponse({
-        'labels': ['Out of Stock', 'Low Stock', 'In Stock'],
-        'datasets': [{
-            'data': [out_of_stock, low_stock, in_stock],
-            'backgroundColor': [
-                'rgba(255, 99, 132, 0.5)',
-                'rgba(255, 206, 86, 0.5)',
-                'rgba(75, 192, 192, 0.5)'
-            ],
-            'borderColor': [
-                'rgba(255, 99, 132, 1)',
-                'rgba(255, 206, 86, 1)',
-                'rgba(75, 192, 192, 1)'
-            ],
-            'borderWidth': 1
-        }]
-    })
+    return JsonResponse(charts.stock_status())
 
+@replica_view
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=chart_etag('new_customers'))
+@cached_chart('new_customers')
 def get_new_customers_chart(request):
     """Line chart showing new customer acquisitions over time"""
-    days = int(request.GET.get('days', 30))
-    start_date = timezone.now() - timedelta(days=days)
-    
-    customers = Customer.objects.filter(
-        created_at__gte=start_date
-    ).values('created_at__date').annotate(
-        count=Count('id')
-    ).order_by('created_at__date')
-
-    return JsonResponse({
-        'labels': [str(entry['created_at__date']) for entry in customers],
-        'datasets': [{
-            'label': 'New Customers',
-            'data': [entry['count'] for entry in customers],
-            'borderColor': 'rgba(153, 102, 255, 1)',
-            'backgroundColor': 'rgba(153, 102, 255, 0.1)',
-            'fill': True
-        }]
-    })
+    return JsonResponse(charts.new_customers(days=int(request.GET.get('days', 30))))
 
+@replica_view
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=chart_etag('sales_by_category'))
+@cached_chart('sales_by_category')
 def get_sales_by_category_chart(request):
     """Bar chart showing sales distribution by category"""
-    days = int(request.GET.get('days', 30))
-    start_date = timezone.now() - timedelta(days=days)
-    
-    sales_by_category = Sale.objects.filter(
-        date__gte=start_date
-    ).values(
-        'items__product__category__name'
-    ).annotate(
-        total_sales=Sum('items__price_at_sale')
-    ).order_by('-total_sales')
+    return JsonResponse(charts.sales_by_category(days=int(request.GET.get('days', 30))))
 
-    return JsonResponse({
-        'labels': [s['items__product__category__name'] or 'Uncategorized' for s in sales_by_category],
-        'datasets': [{
-            'label': 'Sales by Category',
-            'data': [float(s['total_sales']) for s in sales_by_category],
-            'backgroundColor': 'rgba(54, 162, 235, 0.5)',
-            'borderColor': 'rgba(54, 162, 235, 1)',
-            'borderWidth': 1
-        }]
-    })
+@replica_view
+@require_GET
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=chart_etag('dashboard'))
+@cached_chart('dashboard')
+def get_dashboard_data(request):
+    """
+    All dashboard datasets in one response, keyed by chart name. Filters use
+    `<chart>_<param>` names (e.g. topSelling_days); pass `chart` one or more
+    times to rebuild only those charts after a filter change.
+    """
+    requested = request.GET.getlist('chart')
+    unknown = [name for name in requested if name not in charts.CHARTS]
+    if unknown:
+        return JsonResponse({'error': f'Unknown chart: {", ".join(unknown)}'}, status=400)
+    return JsonResponse(charts.dashboard_data(request.GET, requested or charts.CHARTS))
+
+def _product_etag(request, product_id):
+    updated_at = Product.objects.filter(pk=product_id).values_list('updated_at', flat=True).first()
+    if updated_at is not None:
+        return f'product-{product_id}-{updated_at.timestamp()}'
+
+def _barcode_etag(request, barcode):
+    product = Product.objects.filter(barcode=barcode).values_list('pk', 'updated_at').first()
+    if product is not None:
+        return f'barcode-{product[0]}-{product[1].timestamp()}'
 
 @require_GET
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=_product_etag)
 def get_product_price(request, product_id):
     """API endpoint to get a product's selling price"""
-    print(f"API called for product ID: {product_id}")  # Debug log
     try:
         product = Product.objects.get(pk=product_id)
         price_value = float(product.selling_price) if product.selling_price else 0
-        print(f"Returning price: {price_value}")  # Debug log
         return JsonResponse({
             'success': True,
             'price': price_value
@@ -226,11 +119,71 @@ def get_product_price(request, product_id):
             'error': 'Product not found'
         }, status=404)
 
+def _day_start(value):
+    return timezone.make_aware(datetime.combine(date.fromisoformat(value), time.min))
+
+@replica_view
+@staff_member_required
+@require_GET
+def get_stock_history(request, product_id):
+    """
+    A product's stock transactions, newest first, one page at a time. Accepts
+    `limit`, `cursor` (the `next_cursor` of the previous page), `type` and a
+    `since`/`until` date range (YYYY-MM-DD, both inclusive).
+    """
+    if not Product.objects.filter(pk=product_id).exists():
+        return JsonResponse({'success': False, 'error': 'Product not found'}, status=404)
+
+    params = request.GET
+    transaction_type = params.get('type', '').strip() or None
+    if transaction_type and transaction_type not in dict(StockTransaction.TRANSACTION_TYPES):
+        return JsonResponse({'success': False, 'error': f'Unknown transaction type: {transaction_type}'}, status=400)
+    try:
+        limit = min(max(int(params.get('limit', history.PAGE_SIZE)), 1), history.MAX_PAGE_SIZE)
+        since = _day_start(params['since']) if params.get('since') else None
+        until = _day_start(params['until']) + timedelta(days=1) if params.get('until') else None
+        page = history.stock_history(
+            product_id,
+            cursor=params.get('cursor') or None,
+            limit=limit,
+            transaction_type=transaction_type,
+            since=since,
+            until=until,
+        )
+    except ValueError as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=400)
+    return JsonResponse(dict(page, success=True))
+
+@staff_member_required
+@require_GET
+@cache_control(private=True, no_store=True)
+def get_endpoint_stats(request):
+    """
+    Query count, DB time (ms), total time (ms) and response size (bytes)
+    percentiles per endpoint, over the recent requests of every worker.
+    """
+    return JsonResponse({'success': True, 'endpoints': querystats.summary()})
+
+def _metrics_allowed(request):
+    token = settings.METRICS_TOKEN
+    if token and constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return True
+    return request.user.is_active and request.user.is_staff
+
+@require_GET
+def get_metrics(request):
+    """Prometheus metrics of every worker in the text exposition format."""
+    if not _metrics_allowed(request):
+        return HttpResponse('Forbidden', status=403, content_type='text/plain')
+    return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
 def pos_view(request):
     """Render the Point of Sale interface"""
     return render(request, 'inventory/pos.html')
 
 @require_GET
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=_barcode_etag)
 def get_product_by_barcode(request, barcode):
     """API endpoint to get product details by barcode"""
     try:
@@ -251,49 +204,99 @@ def get_product_by_barcode(request, barcode):
             'error': 'Product not found'
         }, status=404)
 
+def _catalog_etag(request):
+    version, count = catalog.watermark()
+    return f'catalog-{version}-{count}-{request.GET.get("since", "")}'
+
+@require_GET
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=_catalog_etag)
+def get_catalog(request):
+    """
+    Barcode catalog for the POS: the full snapshot, or with `?since=<version>`
+    only the products changed since that version.
+    """
+    since = request.GET.get('since', '').strip()
+    if not since:
+        return JsonResponse(catalog.snapshot())
+    try:
+        version = int(since)
+    except ValueError:
+        return JsonResponse({'error': 'since must be a catalog version'}, status=400)
+    return JsonResponse(catalog.changes_since(version))
+
+def _sale_response(result):
+    response = JsonResponse(result.body, status=result.status)
+    if result.replayed:
+        response['Idempotent-Replayed'] = 'true'
+    return response
+
+def _idempotency_key(value):
+    return str(value or '').strip()[:255]
+
 @csrf_exempt
 @require_POST
 def create_sale(request):
-    """API endpoint to create a sale from POS data"""
+    """
+    API endpoint to create a sale from POS data.
+
+    Terminals should send an `Idempotency-Key` header (e.g. a UUID per
+    checkout) and reuse it when retrying: a key that already produced a sale
+    returns the stored response without touching stock again.
+    """
     try:
         data = json.loads(request.body)
         items = data.get('items', [])
-        
+
         if not items:
             return JsonResponse({'success': False, 'error': 'No items in sale'}, status=400)
 
-        with transaction.atomic():
-            # Create the sale
-            sale = Sale.objects.create(
-                total_amount=0,  # Will be calculated by save()
-                profit=0,        # Will be calculated by save()
-                is_paid=True     # POS sales are typically paid immediately
-            )
-
-            for item in items:
-                product_id = item.get('product_id')
-                quantity = item.get('quantity', 1)
-                
-                product = Product.objects.get(id=product_id)
-                
-                SaleItem.objects.create(
-                    sale=sale,
-                    product=product,
-                    quantity=quantity,
-                    price_at_sale=product.selling_price
-                )
-            
-            # Trigger save to calculate totals
-            sale.save()
-
-        return JsonResponse({
-            'success': True, 
-            'sale_id': sale.id,
-            'total_amount': float(sale.total_amount)
-        })
+        # POS sales are typically paid immediately
+        return _sale_response(services.create_sale_once(
+            items, key=_idempotency_key(request.headers.get('Idempotency-Key')), is_paid=True
+        ))
 
     except Exception as e:
         return JsonResponse({
             'success': False, 
             'error': str(e)
-        }, status=500) 
\ No newline at end of file
+        }, status=500)
+
+@csrf_exempt
+@require_POST
+def create_sales_bulk(request):
+    """
+    API endpoint for queued POS sales: `{"sales": [{"idempotency_key": ...,
+    "items": [...]}, ...]}`. Returns one result per sale, in order, each with
+    the status and body the single-sale endpoint would have returned.
+    """
+    try:
+        data = json.loads(request.body)
+    except ValueError:
+        return JsonResponse({'success': False, 'error': 'Invalid JSON'}, status=400)
+    sales = data.get('sales') if isinstance(data, dict) else None
+    if not isinstance(sales, list) or not sales:
+        return JsonResponse({'success': False, 'error': 'No sales to upload'}, status=400)
+    if len(sales) > MAX_BULK_SALES:
+        return JsonResponse({
+            'success': False,
+            'error': f'At most {MAX_BULK_SALES} sales per request'
+        }, status=400)
+
+    # Malformed entries are rejected one by one (create_sale answers 400), not
+    # as a whole batch, so one bad sale cannot block a terminal's queue
+    entries = []
+    for sale in sales:
+        if not isinstance(sale, dict):
+            sale = {}
+        items = sale.get('items')
+        entries.append((_idempotency_key(sale.get('idempotency_key')), [] if items is None else items))
+
+    results = services.create_sales_bulk(entries, is_paid=True)
+    return JsonResponse({
+        'success': True,
+        'results': [
+            dict(result.body, idempotency_key=key, status=result.status, replayed=result.replayed)
+            for (key, _), result in zip(entries, results)
+        ]
+    })